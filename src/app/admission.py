@@ -0,0 +1,233 @@
+import asyncio
+import math
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from .database import (
+    SurveyLocationDB,
+    CatalogueCounterDB,
+    SURVEY_LOCATION_COUNT_COUNTER,
+    OBSERVATION_COUNT_COUNTER,
+    quantize_coordinate,
+    coordinates_key_range
+)
+from .utils import area_query_bounds
+
+class AdmissionController:
+    """
+    Limits the number and cost of requests to a route that are handled at once.
+
+    Requests with an estimated cost above max_cost are rejected straight away with a 429 response.
+    Otherwise up to max_concurrent requests are handled at once, and up to max_queued more wait
+    for a free slot. Requests that find the queue full, or wait longer than timeout seconds,
+    are rejected with a 503 response.
+    """
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queued: int,
+        timeout: float,
+        max_cost: float = math.inf
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.max_cost = max_cost
+        self.active = 0
+        self.metrics = Counter(admitted=0, shed_over_budget=0, shed_queue_full=0, shed_timeout=0)
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def admit(self, cost: float = 0, estimate_cost: Callable[[], Awaitable[float]] | None = None):
+        """
+        Wait for a free slot to handle a request with the given estimated cost,
+        and release the slot on exit.
+
+        If estimating the cost is itself expensive, pass estimate_cost instead, which is only awaited
+        once the request has a slot, so requests that are shed never run it.
+        """
+        self._check_cost(cost)
+        if self.active < self.max_concurrent:
+            self.active += 1
+        else:
+            await self._wait_for_slot()
+        try:
+            if estimate_cost:
+                self._check_cost(await estimate_cost())
+            self.metrics["admitted"] += 1
+            yield
+        finally:
+            self._release()
+
+    def _check_cost(self, cost: float):
+        if cost > self.max_cost:
+            self.metrics["shed_over_budget"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Request is too expensive, try narrowing the query"
+            )
+
+    async def _wait_for_slot(self):
+        if len(self._waiters) >= self.max_queued:
+            self.metrics["shed_queue_full"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": str(math.ceil(self.timeout))}
+            )
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A released slot is handed directly to the waiter, so active is not changed here
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics["shed_timeout"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": str(math.ceil(self.timeout))}
+            )
+        except asyncio.CancelledError:
+            # Pass on a slot that was handed over just as the request was cancelled
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def count_candidate_locations(
+    sessions: list[Session],
+    min_latitude_e6: int,
+    max_latitude_e6: int,
+    min_longitude_e6: int,
+    max_longitude_e6: int,
+    limit: float = math.inf
+) -> int:
+    """
+    Count the survey locations within the given quantized bounds on the given shards,
+    using the coordinates key index.
+
+    Counting stops once limit locations have been found, so the count itself stays cheap
+    for queries that cover large areas. If the bounds cover every valid coordinate,
+    the survey location counters are used instead.
+    """
+    if (
+        min_latitude_e6 <= quantize_coordinate(-90) and max_latitude_e6 >= quantize_coordinate(90)
+        and min_longitude_e6 <= quantize_coordinate(-180) and max_longitude_e6 >= quantize_coordinate(180)
+    ):
+        return sum(db.get(CatalogueCounterDB, SURVEY_LOCATION_COUNT_COUNTER).value for db in sessions)
+    min_key, max_key = coordinates_key_range(min_latitude_e6, max_latitude_e6)
+    count = 0
+    for db in sessions:
+        if count >= limit:
+            break
+        query = db.query(SurveyLocationDB.id).filter(
+            SurveyLocationDB.coordinates_key.between(min_key, max_key),
+            SurveyLocationDB.longitude_e6.between(min_longitude_e6, max_longitude_e6)
+        )
+        if math.isfinite(limit):
+            query = query.limit(math.ceil(limit - count))
+        count += query.count()
+    return count
+
+
+def estimate_location_query_cost(
+    sessions: list[Session],
+    latitude: float,
+    longitude: float,
+    radius: float | None,
+    max_cost: float = math.inf
+) -> float:
+    """
+    Estimate the number of species location rows returned by a location query
+    on the given shards.
+
+    The number of survey locations in the square around the radius is counted using the
+    coordinates key index, then scaled by the area of the circle and the average number
+    of observations at each survey location. Counting stops once the estimate is over max_cost,
+    so the estimate is only exact up to max_cost.
+    """
+    survey_location_count = sum(
+        db.get(CatalogueCounterDB, SURVEY_LOCATION_COUNT_COUNTER).value for db in sessions
+    )
+    if not survey_location_count:
+        return 0
+    observations_per_location = sum(
+        db.get(CatalogueCounterDB, OBSERVATION_COUNT_COUNTER).value for db in sessions
+    ) / survey_location_count
+    if not radius:
+        return observations_per_location
+    latitude_e6 = quantize_coordinate(latitude)
+    longitude_e6 = quantize_coordinate(longitude)
+    radius_e6 = quantize_coordinate(abs(radius))
+    # The circle covers pi/4 of the square around it
+    cost_per_location = math.pi / 4 * observations_per_location
+    candidate_locations = count_candidate_locations(
+        sessions,
+        latitude_e6 - radius_e6,
+        latitude_e6 + radius_e6,
+        longitude_e6 - radius_e6,
+        longitude_e6 + radius_e6,
+        # One location more than the budget allows is enough to reject the query
+        limit=math.floor(max_cost / cost_per_location) + 1 if math.isfinite(max_cost) else math.inf
+    )
+    return candidate_locations * cost_per_location
+
+
+def estimate_area_query_cost(
+    sessions: list[Session],
+    edges: np.ndarray,
+    include_uncertainty: bool = False,
+    max_cost: float = math.inf
+) -> float:
+    """
+    Estimate the number of species location rows loaded by an area query on the given shards.
+
+    Every observation at a survey location within the bounds checked by the query is loaded,
+    including the margin added for coordinate uncertainty, so the number of those survey locations
+    is counted using the coordinates key index, then scaled by the average number of observations
+    at each survey location. Counting stops once the estimate is over max_cost.
+    """
+    survey_location_count = sum(
+        db.get(CatalogueCounterDB, SURVEY_LOCATION_COUNT_COUNTER).value for db in sessions
+    )
+    if not survey_location_count:
+        return 0
+    observations_per_location = sum(
+        db.get(CatalogueCounterDB, OBSERVATION_COUNT_COUNTER).value for db in sessions
+    ) / survey_location_count
+    limit = math.floor(max_cost / observations_per_location) + 1 if math.isfinite(max_cost) else math.inf
+    candidate_locations = 0
+    for db in sessions:
+        # Each shard widens the bounds by the largest uncertainty of its own survey locations
+        min_latitude, max_latitude, min_longitude, max_longitude = area_query_bounds(db, edges, include_uncertainty)
+        # A large uncertainty can widen the bounds past every valid coordinate
+        candidate_locations += count_candidate_locations(
+            [db],
+            quantize_coordinate(max(min_latitude, -90)),
+            quantize_coordinate(min(max_latitude, 90)),
+            quantize_coordinate(max(min_longitude, -180)),
+            quantize_coordinate(min(max_longitude, 180)),
+            limit=limit - candidate_locations
+        )
+        if candidate_locations >= limit:
+            break
+    return candidate_locations * observations_per_location
@@ -0,0 +1,157 @@
+import threading
+from dataclasses import dataclass
+from typing import Literal
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+from .database import SpeciesLocationDB, CatalogueCounterDB, OBSERVATIONS_VERSION_COUNTER
+
+CooccurrenceMetric = Literal["shared_locations", "jaccard"]
+
+@dataclass(frozen=True)
+class IncidenceMatrix:
+    """
+    Species x survey location incidence matrix built from the specieslocations tables of all shards.
+
+    Row i of matrix is the species with id species_ids[i], and an entry is 1 if that species
+    was observed at the survey location for that column. cooccurrence[i, j] is the number
+    of survey locations where species i and species j were both observed.
+    """
+    version: tuple[int, ...]
+    species_ids: np.ndarray
+    matrix: sparse.csr_matrix
+    cooccurrence: sparse.csr_matrix
+
+    @property
+    def location_counts(self) -> np.ndarray:
+        return self.cooccurrence.diagonal()
+
+    def species_index(self, species_id: int) -> int | None:
+        """
+        Return the row of the given species, or None if it has no observations.
+        """
+        index = np.searchsorted(self.species_ids, species_id)
+        if index < len(self.species_ids) and self.species_ids[index] == species_id:
+            return int(index)
+        return None
+
+    def jaccard(self, rows: np.ndarray, cols: np.ndarray, shared: np.ndarray) -> np.ndarray:
+        """
+        Return the Jaccard similarity of each pair of species rows and cols,
+        given the number of locations they share.
+        """
+        location_counts = self.location_counts
+        return shared / (location_counts[rows] + location_counts[cols] - shared)
+
+
+def build_incidence_matrix(sessions: list[Session], version: tuple[int, ...]) -> IncidenceMatrix:
+    """
+    Build the incidence matrix and species co-occurrence counts from the databases of all shards.
+
+    Survey location ids are unique across shards, so observations from each shard can be combined.
+    """
+    observations = np.array(
+        [
+            observation for db in sessions for observation in
+            db.query(SpeciesLocationDB.species_id, SpeciesLocationDB.survey_location_id)
+        ],
+        dtype=np.int64
+    ).reshape(-1, 2)
+    species_ids, rows = np.unique(observations[:, 0], return_inverse=True)
+    location_ids, cols = np.unique(observations[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(observations), dtype=np.int64), (rows, cols)),
+        shape=(len(species_ids), len(location_ids))
+    )
+    # Species observed more than once at a location are only counted once
+    matrix.data[:] = 1
+    return IncidenceMatrix(
+        version=version,
+        species_ids=species_ids,
+        matrix=matrix,
+        cooccurrence=(matrix @ matrix.T).tocsr()
+    )
+
+
+_incidence_matrix: IncidenceMatrix | None = None
+_incidence_matrix_lock = threading.Lock()
+
+def get_incidence_matrix(sessions: list[Session]) -> IncidenceMatrix:
+    """
+    Return the incidence matrix for the current observations in the databases of all shards.
+
+    The matrix is cached and only rebuilt when the observations version counter of a shard changes.
+    """
+    global _incidence_matrix
+    version = tuple(
+        db.get(CatalogueCounterDB, OBSERVATIONS_VERSION_COUNTER).value for db in sessions
+    )
+    with _incidence_matrix_lock:
+        if _incidence_matrix is None or _incidence_matrix.version != version:
+            _incidence_matrix = build_incidence_matrix(sessions, version)
+        return _incidence_matrix
+
+
+def _rank(
+    shared: np.ndarray,
+    jaccard: np.ndarray,
+    metric: CooccurrenceMetric,
+    limit: int
+) -> np.ndarray:
+    """
+    Return the indices of the limit highest ranked items by the given metric,
+    using the other metric to break ties.
+    """
+    primary, secondary = (shared, jaccard) if metric == "shared_locations" else (jaccard, shared)
+    # np.lexsort sorts by the last key first
+    return np.lexsort((-secondary, -primary))[:limit]
+
+
+def species_cooccurrence(
+    incidence: IncidenceMatrix,
+    species_id: int,
+    metric: CooccurrenceMetric,
+    limit: int
+) -> list[tuple[int, int, float]]:
+    """
+    Return (species id, shared locations, jaccard similarity) for the species
+    most often observed at the same locations as the given species.
+    """
+    index = incidence.species_index(species_id)
+    if index is None:
+        return []
+    row = incidence.cooccurrence.getrow(index).tocoo()
+    others = row.col != index
+    cols, shared = row.col[others], row.data[others]
+    jaccard = incidence.jaccard(np.full_like(cols, index), cols, shared)
+    ranked = _rank(shared, jaccard, metric, limit)
+    return [
+        (int(incidence.species_ids[cols[i]]), int(shared[i]), float(jaccard[i]))
+        for i in ranked
+    ]
+
+
+def top_cooccurring_pairs(
+    incidence: IncidenceMatrix,
+    metric: CooccurrenceMetric,
+    limit: int
+) -> list[tuple[int, int, int, float]]:
+    """
+    Return (species id, other species id, shared locations, jaccard similarity)
+    for the pairs of species most often observed at the same locations.
+    """
+    # Each pair appears twice in the symmetric co-occurrence matrix, so only use the upper triangle
+    pairs = sparse.triu(incidence.cooccurrence, k=1).tocoo()
+    jaccard = incidence.jaccard(pairs.row, pairs.col, pairs.data)
+    ranked = _rank(pairs.data, jaccard, metric, limit)
+    return [
+        (
+            int(incidence.species_ids[pairs.row[i]]),
+            int(incidence.species_ids[pairs.col[i]]),
+            int(pairs.data[i]),
+            float(jaccard[i])
+        )
+        for i in ranked
+    ]
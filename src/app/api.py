@@ -1,24 +1,138 @@
+import asyncio
+import sys
 from typing import Annotated
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-from fastapi import Depends, FastAPI, HTTPException, Query, Response
+import numpy as np
+from sqlalchemy import delete, exc, func
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from .database import SessionLocal, SurveyLocationDB, SpeciesDB, SpeciesLocationDB
+from .database import (
+    SessionLocal,
+    ShardRouter,
+    ShardSessions,
+    shard_router,
+    SurveyLocationDB,
+    SpeciesDB,
+    SpeciesLocationDB,
+    COORDINATE_SCALE,
+    quantize_coordinate,
+    pack_coordinates,
+    coordinates_key_range
+)
 from .schemas import (
     Species,
     PaginatedResponse,
     SurveyLocation,
     SpeciesPatch,
     SpeciesLocationCreate,
-    SpeciesLocationResponse
+    SpeciesLocationResponse,
+    SpeciesLocationEvent,
+    AreaQuery,
+    SpeciesLocations,
+    SpeciesCount,
+    SpeciesDeleted,
+    SpeciesCooccurrence,
+    SpeciesPairCooccurrence,
+    AdmissionMetrics,
+    ImportJobResponse,
+    ImportRowError
+)
+from .utils import (
+    batched,
+    delete_species_from_shards,
+    update_species_in_shards,
+    find_or_create_survey_location,
+    find_or_copy_species,
+    get_species_by_ids,
+    get_species_count,
+    get_species_ids_in_area
+)
+from .geometry import parse_wkt_polygon, bounding_box_edges, edges_bounds
+from .analytics import (
+    CooccurrenceMetric,
+    get_incidence_matrix,
+    species_cooccurrence,
+    top_cooccurring_pairs
 )
-from .utils import find_or_create_survey_location
+from .admission import AdmissionController, estimate_location_query_cost, estimate_area_query_cost
+from .events import RegionFilter, event_bus
+from .imports import UploadSpool, UploadTooLargeError, import_jobs
 
 MAX_PAGE_SIZE = 100
 DEFAULT_PAGE_SIZE = 25
+# A radius this large (in degrees) already covers every valid coordinate
+MAX_RADIUS = 360
+MAX_BATCH_SIZE = 1000
+MAX_COOCCURRENCE_LIMIT = 1000
+DEFAULT_COOCCURRENCE_LIMIT = 25
+
+# Estimated number of species location rows a single location query may return
+MAX_LOCATION_QUERY_COST = 100_000
+# Estimated number of species location rows a single area query may load
+MAX_AREA_QUERY_COST = 100_000
+# Seconds between keep-alive comments sent on idle event streams
+EVENT_STREAM_KEEP_ALIVE = 15
+# Maximum number of errors reported for an invalid upload, after which the rest of it is not read
+MAX_IMPORT_ERRORS = 100
+# Maximum size in bytes of an uploaded file, after decompression
+MAX_IMPORT_SIZE = 1024**3
+# Seconds clients are asked to wait before retrying a write while the database is locked by another writer
+DATABASE_LOCKED_RETRY_AFTER = 5
+
+# Query parameters for coordinates in degrees, which must be valid latitudes and longitudes.
+# NaN fails every comparison, so the bounds also reject it.
+Latitude = Annotated[float, Query(ge=-90, le=90)]
+Longitude = Annotated[float, Query(ge=-180, le=180)]
+OptionalLatitude = Annotated[float | None, Query(ge=-90, le=90)]
+OptionalLongitude = Annotated[float | None, Query(ge=-180, le=180)]
+# Radii of any finite size are allowed, since they are capped at MAX_RADIUS
+Radius = Annotated[float | None, Query(ge=-sys.float_info.max, le=sys.float_info.max)]
 
 api = FastAPI(title="Species survey data API")
 
+@api.exception_handler(exc.OperationalError)
+async def database_locked_handler(request: Request, err: exc.OperationalError):
+    """
+    Respond with 503 Service Unavailable to writes that time out waiting for the database,
+    which is locked while another writer such as an import job is writing to it.
+    """
+    if "database is locked" not in str(err.orig):
+        raise err
+    return JSONResponse(
+        status_code=503,
+        content=dict(detail="Database is locked by another writer, try again later"),
+        headers={"Retry-After": str(DATABASE_LOCKED_RETRY_AFTER)}
+    )
+
+# Limits on concurrent requests to expensive routes, so they can't starve cheap ones
+admission_controllers = {
+    "/location/species": AdmissionController(
+        max_concurrent=4,
+        max_queued=16,
+        timeout=5.0,
+        max_cost=MAX_LOCATION_QUERY_COST
+    ),
+    "/location/species/area": AdmissionController(
+        max_concurrent=4,
+        max_queued=16,
+        timeout=5.0,
+        max_cost=MAX_AREA_QUERY_COST
+    ),
+    "/species/locations/batch": AdmissionController(max_concurrent=4, max_queued=16, timeout=5.0),
+    "/species/{scientific_name_id}/cooccurrence": AdmissionController(
+        max_concurrent=2,
+        max_queued=8,
+        timeout=10.0
+    ),
+    "/cooccurrence": AdmissionController(max_concurrent=2, max_queued=8, timeout=10.0),
+}
+ADMISSION_RESPONSES = {
+    429: dict(description="Request too expensive"),
+    503: dict(description="Too many concurrent requests"),
+}
+
 def get_db():
     """
     Yield database session and close after finishing.
@@ -29,14 +143,143 @@ def get_db():
     finally:
         db.close()
 
-# API endpoints
+def get_session_factory() -> sessionmaker:
+    """
+    Return the factory for database sessions used outside of a request, such as by import jobs.
+    """
+    return SessionLocal
 
-@api.get("/location/species", response_model=list[Species])
-def get_species_at_location(
+def get_shard_router() -> ShardRouter:
+    """
+    Return the router used to find the shards holding survey locations.
+    """
+    return shard_router
+
+def get_shards(db: Session = Depends(get_db), router: ShardRouter = Depends(get_shard_router)):
+    """
+    Yield sessions on the shards holding survey locations and close after finishing.
+    """
+    shards = ShardSessions(db, router)
+    try:
+        yield shards
+    finally:
+        shards.close()
+
+def location_query_bounds(
     latitude: float,
     longitude: float,
-    radius: float | None = None,
-    db: Session = Depends(get_db)
+    radius: float
+) -> tuple[float, float, float, float]:
+    """
+    Return the (min latitude, max latitude, min longitude, max longitude) of the square around
+    a location query's radius, computed from the quantized coordinates the query is matched on.
+    """
+    latitude_e6 = quantize_coordinate(latitude)
+    longitude_e6 = quantize_coordinate(longitude)
+    radius_e6 = quantize_coordinate(radius)
+    return (
+        (latitude_e6 - radius_e6) / COORDINATE_SCALE,
+        (latitude_e6 + radius_e6) / COORDINATE_SCALE,
+        (longitude_e6 - radius_e6) / COORDINATE_SCALE,
+        (longitude_e6 + radius_e6) / COORDINATE_SCALE
+    )
+
+def admit(route: str):
+    """
+    Return a dependency that admits requests to the given route through its admission controller.
+    """
+    async def admit_request():
+        async with admission_controllers[route].admit():
+            yield
+    return admit_request
+
+async def admit_location_query(
+    latitude: Latitude,
+    longitude: Longitude,
+    radius: Radius = None,
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    Admit a location query through its admission controller, based on its estimated cost.
+    """
+    controller = admission_controllers["/location/species"]
+    radius = min(abs(radius or 0), MAX_RADIUS)
+
+    def estimate_cost() -> float:
+        return estimate_location_query_cost(
+            shards.for_bounds(*location_query_bounds(latitude, longitude, radius)),
+            latitude,
+            longitude,
+            radius,
+            max_cost=controller.max_cost
+        )
+    # The cost is only estimated once the query has a slot, so shed queries don't run it
+    async with controller.admit(estimate_cost=lambda: run_in_threadpool(estimate_cost)):
+        yield
+
+def get_area_edges(area: AreaQuery) -> np.ndarray:
+    """
+    Return the edges of the bounding box or polygon of an area query.
+    """
+    if (area.bounding_box is None) == (area.wkt is None):
+        raise HTTPException(
+            status_code=422,
+            detail="Exactly one of bounding_box or wkt is required"
+        )
+    if area.bounding_box:
+        return bounding_box_edges(**area.bounding_box.model_dump())
+    try:
+        return parse_wkt_polygon(area.wkt)
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err))
+
+def get_area_shards(
+    area: AreaQuery,
+    edges: np.ndarray = Depends(get_area_edges),
+    shards: ShardSessions = Depends(get_shards)
+) -> list[Session]:
+    """
+    Return sessions for the shards that could hold survey locations matching an area query.
+    """
+    if area.include_uncertainty:
+        # Uncertainty circles can reach into the area from any shard
+        return shards.all()
+    return shards.for_bounds(*edges_bounds(edges))
+
+async def admit_area_query(
+    area: AreaQuery,
+    edges: np.ndarray = Depends(get_area_edges),
+    sessions: list[Session] = Depends(get_area_shards)
+):
+    """
+    Admit an area query through its admission controller, based on its estimated cost.
+    """
+    controller = admission_controllers["/location/species/area"]
+
+    def estimate_cost() -> float:
+        return estimate_area_query_cost(
+            sessions,
+            edges,
+            include_uncertainty=area.include_uncertainty,
+            max_cost=controller.max_cost
+        )
+    # The cost is only estimated once the query has a slot, so shed queries don't run it
+    async with controller.admit(estimate_cost=lambda: run_in_threadpool(estimate_cost)):
+        yield
+
+# API endpoints
+
+@api.get(
+    "/location/species",
+    response_model=list[Species],
+    responses=ADMISSION_RESPONSES,
+    dependencies=[Depends(admit_location_query)]
+)
+def get_species_at_location(
+    latitude: Latitude,
+    longitude: Longitude,
+    radius: Radius = None,
+    shards: ShardSessions = Depends(get_shards)
 ):
     """
     Retrieves a list of all species at a particular latitude and longitude.
@@ -44,28 +287,139 @@ def get_species_at_location(
     If radius is specified, then all species within the radius of 
     the given latitude and longitude are returned.
     """
+    latitude_e6 = quantize_coordinate(latitude)
+    longitude_e6 = quantize_coordinate(longitude)
     if radius:
         # Return all species within given radius of provided latitude and longitude
-        return (
-            db.query(SpeciesDB)
+        radius = min(abs(radius), MAX_RADIUS)
+        radius_e6 = quantize_coordinate(radius)
+        # Only locations in the band of latitudes covered by the radius can match,
+        # which can be found with a range scan on the coordinates key index
+        min_key, max_key = coordinates_key_range(latitude_e6 - radius_e6, latitude_e6 + radius_e6)
+        filters = (
+            SurveyLocationDB.coordinates_key.between(min_key, max_key),
+            (SurveyLocationDB.latitude_e6 - latitude_e6) * (SurveyLocationDB.latitude_e6 - latitude_e6)
+            + (SurveyLocationDB.longitude_e6 - longitude_e6) * (SurveyLocationDB.longitude_e6 - longitude_e6)
+            <= radius_e6**2
+        )
+    else:
+        # Return all species at exact latitude and longitude
+        radius = 0
+        filters = (
+            SurveyLocationDB.coordinates_key == pack_coordinates(latitude_e6, longitude_e6),
+        )
+    # Only search the shards that could hold locations within the radius
+    return [
+        species
+        for shard in shards.for_bounds(*location_query_bounds(latitude, longitude, radius))
+        for species in (
+            shard.query(SpeciesDB)
             .join(SpeciesLocationDB, SpeciesDB.id == SpeciesLocationDB.species_id)
             .join(SurveyLocationDB, SpeciesLocationDB.survey_location_id == SurveyLocationDB.id)
-            .filter(
-                func.pow(SurveyLocationDB.latitude - latitude, 2)
-                + func.pow(SurveyLocationDB.longitude - longitude, 2)
-                <= radius**2
-            )
+            .filter(*filters)
+            .order_by(SpeciesLocationDB.id)
         )
-    # Return all species at exact latitude and longitude
-    return (
-        db.query(SpeciesDB)
-        .join(SpeciesLocationDB, SpeciesDB.id == SpeciesLocationDB.species_id)
-        .join(SurveyLocationDB, SpeciesLocationDB.survey_location_id == SurveyLocationDB.id)
-        .filter(
-            SurveyLocationDB.latitude == latitude,
-            SurveyLocationDB.longitude == longitude
+    ]
+
+@api.post(
+    "/location/species/area",
+    response_model=list[Species],
+    responses={422: dict(description="Invalid area"), **ADMISSION_RESPONSES},
+    dependencies=[Depends(admit_area_query)]
+)
+def get_species_in_area(
+    area: AreaQuery,
+    edges: np.ndarray = Depends(get_area_edges),
+    sessions: list[Session] = Depends(get_area_shards),
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    Retrieves a list of all species observed within a bounding box or polygon.
+
+    The polygon is given as a WKT POLYGON or MULTIPOLYGON, with coordinates in
+    (longitude latitude) order. If include_uncertainty is true, then species observed at
+    survey locations whose coordinate uncertainty reaches into the area are also returned.
+    """
+    species_ids = list(dict.fromkeys(
+        species_id for shard in sessions for species_id in get_species_ids_in_area(
+            shard,
+            edges,
+            include_uncertainty=area.include_uncertainty,
+            is_bounding_box=area.bounding_box is not None
         )
-    )
+    ))
+    species = get_species_by_ids(shards.db, species_ids)
+    return [species[species_id] for species_id in species_ids]
+
+@api.get(
+    "/location/species/events",
+    response_class=StreamingResponse,
+    responses={
+        200: dict(content={"text/event-stream": {}}, description="Stream of species location events"),
+        422: dict(description="Invalid region")
+    }
+)
+async def get_species_location_events(
+    latitude: OptionalLatitude = None,
+    longitude: OptionalLongitude = None,
+    radius: Radius = None,
+    min_latitude: OptionalLatitude = None,
+    max_latitude: OptionalLatitude = None,
+    min_longitude: OptionalLongitude = None,
+    max_longitude: OptionalLongitude = None,
+    kingdom: str | None = None,
+    phylum: str | None = None,
+    species_class: str | None = None,
+    order: str | None = None,
+    family: str | None = None,
+    genus: str | None = None
+):
+    """
+    Stream new species location records as server-sent events.
+
+    Either a latitude and longitude (and optionally a radius), or a bounding box must be given.
+    Only species locations within the region, and matching any taxonomy filters, are streamed.
+    """
+    point = (latitude, longitude)
+    bounding_box = (min_latitude, max_latitude, min_longitude, max_longitude)
+    if all(v is not None for v in point) and all(v is None for v in bounding_box):
+        region = RegionFilter(latitude=latitude, longitude=longitude, radius=radius)
+    elif all(v is not None for v in bounding_box) and all(v is None for v in (*point, radius)):
+        region = RegionFilter(*bounding_box)
+    else:
+        raise HTTPException(
+            status_code=422,
+            detail="Either latitude and longitude, or a bounding box, is required"
+        )
+    taxonomy = {
+        field: value for field, value in dict(
+            kingdom=kingdom,
+            phylum=phylum,
+            species_class=species_class,
+            order=order,
+            family=family,
+            genus=genus
+        ).items()
+        if value is not None
+    }
+
+    async def stream_events():
+        subscription = event_bus.subscribe(region, taxonomy)
+        try:
+            while True:
+                try:
+                    event: SpeciesLocationEvent = await asyncio.wait_for(
+                        subscription.get(),
+                        EVENT_STREAM_KEEP_ALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: species_location\nid: {event.id}\ndata: {event.model_dump_json()}\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(stream_events(), media_type="text/event-stream")
 
 @api.get(
     "/species",
@@ -81,7 +435,7 @@ def get_all_species(
     Retrieve a paginated list of all species records.
     """
     # Verify supplied page number within allowed range
-    species_count = db.query(SpeciesDB).count()
+    species_count = get_species_count(db)
     max_page_number = int(species_count/page_size)
     if page > max_page_number:
         raise HTTPException(
@@ -101,6 +455,16 @@ def get_all_species(
         data=species
     )
 
+@api.get("/species/count", response_model=SpeciesCount)
+def get_species_count_total(exact: bool = False, db: Session = Depends(get_db)):
+    """
+    Retrieve the total number of species records.
+
+    The count is read from a maintained counter unless exact is true,
+    in which case all species records are counted.
+    """
+    return SpeciesCount(count=get_species_count(db, exact=exact))
+
 @api.get(
     "/species/{scientific_name_id}/locations",
     response_model=list[SurveyLocation],
@@ -109,45 +473,228 @@ def get_all_species(
 )
 def get_species_locations(
     scientific_name_id: int,
-    db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
 ):
     """
     Retrieve a list of all locations where a specific species is found.
     """
     # Check supplied species id is valid
-    if not db.get(SpeciesDB, scientific_name_id):
+    if not shards.db.get(SpeciesDB, scientific_name_id):
         raise HTTPException(
             status_code=404,
             detail=f"Species with id {scientific_name_id} not found"
         )
-    return (
-        db.query(SurveyLocationDB)
-        .join(SpeciesLocationDB, SpeciesLocationDB.survey_location_id == SurveyLocationDB.id)
-        .join(SpeciesDB, SpeciesDB.id == SpeciesLocationDB.species_id)
-        .where(
-            SpeciesDB.id == scientific_name_id
+    return [
+        survey_location for shard in shards.all() for survey_location in (
+            shard.query(SurveyLocationDB)
+            .join(SpeciesLocationDB, SpeciesLocationDB.survey_location_id == SurveyLocationDB.id)
+            .join(SpeciesDB, SpeciesDB.id == SpeciesLocationDB.species_id)
+            .where(
+                SpeciesDB.id == scientific_name_id
+            )
         )
-    )
+    ]
+
+@api.post(
+    "/species/locations/batch",
+    response_model=list[SpeciesLocations],
+    response_model_exclude_none=True,
+    responses=ADMISSION_RESPONSES,
+    dependencies=[Depends(admit("/species/locations/batch"))]
+)
+def get_batch_species_locations(
+    scientific_name_ids: Annotated[list[int], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    counts_only: Annotated[bool, Body()] = False,
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    Retrieve the locations where each of the given species is found.
+
+    If counts_only is true, only the number of locations is returned for each species.
+    Species ids not found in the database are reported with found set to false.
+    """
+    # Remove duplicate ids but keep the order they were requested in
+    scientific_name_ids = list(dict.fromkeys(scientific_name_ids))
+    if shards.enabled:
+        # Shards only hold copies of species observed in them, so find species in the main database
+        found = set(get_species_by_ids(shards.db, scientific_name_ids))
+    else:
+        found = set()
+    if counts_only:
+        counts: dict[int, int] = {}
+        for shard in shards.all():
+            for species_id, count in (
+                row for ids in batched(scientific_name_ids) for row in
+                shard.query(SpeciesDB.id, func.count(SpeciesLocationDB.id))
+                .outerjoin(SpeciesLocationDB, SpeciesLocationDB.species_id == SpeciesDB.id)
+                .filter(SpeciesDB.id.in_(ids))
+                .group_by(SpeciesDB.id)
+            ):
+                counts[species_id] = counts.get(species_id, 0) + count
+        found.update(counts)
+        return [
+            SpeciesLocations(
+                scientific_name_id=id,
+                found=id in found,
+                locations_count=counts.get(id, 0) if id in found else None
+            ) for id in scientific_name_ids
+        ]
+    locations: dict[int, list[SurveyLocationDB]] = {}
+    for shard in shards.all():
+        for species_id, survey_location in (
+            row for ids in batched(scientific_name_ids) for row in
+            shard.query(SpeciesDB.id, SurveyLocationDB)
+            .outerjoin(SpeciesLocationDB, SpeciesLocationDB.species_id == SpeciesDB.id)
+            .outerjoin(SurveyLocationDB, SpeciesLocationDB.survey_location_id == SurveyLocationDB.id)
+            .filter(SpeciesDB.id.in_(ids))
+        ):
+            species_locations = locations.setdefault(species_id, [])
+            if survey_location:
+                species_locations.append(survey_location)
+    found.update(locations)
+    return [
+        SpeciesLocations(
+            scientific_name_id=id,
+            found=id in found,
+            locations=locations.get(id, []) if id in found else None,
+            locations_count=len(locations.get(id, [])) if id in found else None
+        ) for id in scientific_name_ids
+    ]
+
+@api.get(
+    "/species/{scientific_name_id}/cooccurrence",
+    response_model=list[SpeciesCooccurrence],
+    responses={404: dict(description="Species not found"), **ADMISSION_RESPONSES},
+    dependencies=[Depends(admit("/species/{scientific_name_id}/cooccurrence"))]
+)
+def get_species_cooccurrence(
+    scientific_name_id: int,
+    metric: CooccurrenceMetric = "shared_locations",
+    limit: Annotated[int, Query(ge=1, le=MAX_COOCCURRENCE_LIMIT)] = DEFAULT_COOCCURRENCE_LIMIT,
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    Retrieve the species most often observed at the same survey locations as a specific species.
+
+    Results are ranked by the number of shared survey locations, or by the Jaccard similarity
+    of the sets of locations where each species was observed.
+    """
+    db = shards.db
+    # Check supplied species id is valid
+    if not db.get(SpeciesDB, scientific_name_id):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Species with id {scientific_name_id} not found"
+        )
+    results = species_cooccurrence(get_incidence_matrix(shards.all()), scientific_name_id, metric, limit)
+    species = get_species_by_ids(db, (species_id for species_id, *_ in results))
+    return [
+        SpeciesCooccurrence(
+            species=species[species_id],
+            shared_locations=shared_locations,
+            jaccard=jaccard
+        ) for species_id, shared_locations, jaccard in results
+    ]
+
+@api.get(
+    "/cooccurrence",
+    response_model=list[SpeciesPairCooccurrence],
+    responses=ADMISSION_RESPONSES,
+    dependencies=[Depends(admit("/cooccurrence"))]
+)
+def get_top_cooccurring_species(
+    metric: CooccurrenceMetric = "shared_locations",
+    limit: Annotated[int, Query(ge=1, le=MAX_COOCCURRENCE_LIMIT)] = DEFAULT_COOCCURRENCE_LIMIT,
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    Retrieve the pairs of species most often observed at the same survey locations.
+
+    Results are ranked by the number of shared survey locations, or by the Jaccard similarity
+    of the sets of locations where each species was observed.
+    """
+    results = top_cooccurring_pairs(get_incidence_matrix(shards.all()), metric, limit)
+    species_ids = {species_id for pair in results for species_id in pair[:2]}
+    species = get_species_by_ids(shards.db, species_ids)
+    return [
+        SpeciesPairCooccurrence(
+            species=(species[species_id], species[other_species_id]),
+            shared_locations=shared_locations,
+            jaccard=jaccard
+        ) for species_id, other_species_id, shared_locations, jaccard in results
+    ]
 
 @api.delete(
     "/species/{scientific_name_id}",
     responses={404: dict(description="Species not found")}
 )
-def delete_species(scientific_name_id: int, db: Session = Depends(get_db)):
+def delete_species(scientific_name_id: int, shards: ShardSessions = Depends(get_shards)):
     """
     Delete species with given id from the database.
     """
-    species = db.get(SpeciesDB, scientific_name_id)
-    if not species:
+    db = shards.db
+    # Locations of the species are deleted by the database's ON DELETE CASCADE
+    result = db.execute(delete(SpeciesDB).where(SpeciesDB.id == scientific_name_id))
+    if not result.rowcount:
         raise HTTPException(
             status_code=404,
             detail=f"Species with id {scientific_name_id} not found"
         )
-    db.delete(species)
-    db.commit()
+    delete_species_from_shards(shards, SpeciesDB.id == scientific_name_id)
+    shards.commit()
     return Response(status_code=200)
 
 
+@api.delete(
+    "/species",
+    response_model=SpeciesDeleted,
+    responses={422: dict(description="No species ids or taxonomy filters supplied")}
+)
+def delete_many_species(
+    scientific_name_id: Annotated[list[int], Query()] = [],
+    kingdom: str | None = None,
+    phylum: str | None = None,
+    species_class: str | None = None,
+    order: str | None = None,
+    family: str | None = None,
+    genus: str | None = None,
+    shards: ShardSessions = Depends(get_shards)
+):
+    """
+    Delete all species matching the given species ids and taxonomy filters from the database.
+
+    At least one species id or taxonomy filter must be supplied.
+    """
+    filters = [
+        getattr(SpeciesDB, field) == value
+        for field, value in dict(
+            kingdom=kingdom,
+            phylum=phylum,
+            species_class=species_class,
+            order=order,
+            family=family,
+            genus=genus
+        ).items()
+        if value is not None
+    ]
+    # Refuse to delete every species when no filters are given
+    if not filters and not scientific_name_id:
+        raise HTTPException(
+            status_code=422,
+            detail="At least one species id or taxonomy filter is required"
+        )
+    # Species ids are deleted in batches, to keep within the database's limit on bound parameters
+    batch_filters = [
+        (*filters, SpeciesDB.id.in_(ids)) for ids in batched(scientific_name_id)
+    ] if scientific_name_id else [filters]
+    deleted_count = 0
+    for species_filters in batch_filters:
+        deleted_count += shards.db.execute(delete(SpeciesDB).where(*species_filters)).rowcount
+        delete_species_from_shards(shards, *species_filters)
+    shards.commit()
+    return SpeciesDeleted(deleted_count=deleted_count)
+
+
 @api.patch(
     "/species/{scientific_name_id}",
     response_model=Species,
@@ -156,11 +703,12 @@ def delete_species(scientific_name_id: int, db: Session = Depends(get_db)):
 def patch_species(
     scientific_name_id: int,
     species_patch: SpeciesPatch,
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_shards)
 ):
     """
     Update a species with given id from database.
     """
+    db = shards.db
     # Check supplied species id is valid
     species: SpeciesDB = db.get(SpeciesDB, scientific_name_id)
     if not species:
@@ -171,7 +719,9 @@ def patch_species(
     # Update species entry in database
     for field, value in species_patch:
         setattr(species, field, value)
-    db.commit()
+    # Keep the copies of the species in each shard up to date
+    update_species_in_shards(shards, scientific_name_id, species_patch.model_dump())
+    shards.commit()
     return species
 
 
@@ -184,7 +734,7 @@ def patch_species(
 def report_species_location(
     scientific_name_id: int,
     species_location: SpeciesLocationCreate,
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_shards)
 ):
     """
     Create a new species location record in the database.
@@ -193,12 +743,16 @@ def report_species_location(
     then a new servey location record is also created in the database.
     """
     # Check supplied species id is valid
-    species: SpeciesDB = db.get(SpeciesDB, scientific_name_id)
+    species: SpeciesDB = shards.db.get(SpeciesDB, scientific_name_id)
     if not species:
         raise HTTPException(
             status_code=404,
             detail=f"Species with id {scientific_name_id} not found"
         )
+    # Survey locations are written to the shard covering their coordinates
+    db = shards.for_point(species_location.latitude, species_location.longitude)
+    if db is not shards.db:
+        find_or_copy_species(db, species)
     survey_location: SurveyLocationDB = find_or_create_survey_location(
         db,
         species_location.latitude,
@@ -211,8 +765,100 @@ def report_species_location(
     )
     db.add(species_location)
     db.commit()
+    event_bus.publish(
+        SpeciesLocationEvent(
+            id=species_location.id,
+            species=species,
+            survey_location=survey_location
+        )
+    )
     return SpeciesLocationResponse(
         species=species,
         survey_location=survey_location
     )
 
+
+@api.post(
+    "/imports",
+    status_code=202,
+    response_model=ImportJobResponse,
+    responses={
+        400: dict(description="Invalid gzip data"),
+        413: dict(description="Upload too large"),
+        422: dict(model=list[ImportRowError], description="Invalid species survey data")
+    },
+    openapi_extra=dict(requestBody=dict(
+        content={"text/csv": dict(schema=dict(type="string", format="binary"))},
+        required=True
+    ))
+)
+async def create_import(
+    request: Request,
+    session_factory: sessionmaker = Depends(get_session_factory),
+    router: ShardRouter = Depends(get_shard_router)
+):
+    """
+    Upload a CSV file of species survey data to be imported in the background.
+
+    The request body is validated as it is streamed to a temporary file, so it is never held
+    in memory, and may be gzip compressed with a Content-Encoding: gzip header.
+    Uploads larger than MAX_IMPORT_SIZE bytes (after decompression) are rejected.
+    If any rows are invalid nothing is imported, and the errors are returned with their line numbers.
+    Otherwise an import job is queued, and its progress can be followed at /imports/{job_id}.
+    """
+    upload = UploadSpool(
+        gzip=request.headers.get("content-encoding") == "gzip",
+        max_errors=MAX_IMPORT_ERRORS,
+        max_size=MAX_IMPORT_SIZE
+    )
+    try:
+        async for chunk in request.stream():
+            # Parse chunks in the threadpool, so large uploads don't hold up other requests
+            await run_in_threadpool(upload.write, chunk)
+            if upload.full:
+                break
+        await run_in_threadpool(upload.close)
+    except UploadTooLargeError as err:
+        upload.discard()
+        raise HTTPException(status_code=413, detail=str(err))
+    except ValueError as err:
+        upload.discard()
+        raise HTTPException(status_code=400, detail=str(err))
+    except BaseException:
+        upload.discard()
+        raise
+    if upload.errors:
+        upload.discard()
+        raise HTTPException(
+            status_code=422,
+            detail=[ImportRowError(line=line, message=message).model_dump() for line, message in upload.errors]
+        )
+    return import_jobs.submit(upload.filepath, upload.row_count, session_factory, router)
+
+
+@api.get("/imports/{job_id}", response_model=ImportJobResponse)
+def get_import(job_id: str):
+    """
+    Retrieve the status and progress of an import job.
+    """
+    job = import_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Import job with id {job_id} not found"
+        )
+    return job
+
+
+@api.get("/metrics/admission", response_model=dict[str, AdmissionMetrics])
+def get_admission_metrics():
+    """
+    Retrieve the number of requests admitted and shed by each route's admission controller.
+    """
+    return {
+        route: AdmissionMetrics(
+            active=controller.active,
+            queued=controller.queued,
+            **controller.metrics
+        ) for route, controller in admission_controllers.items()
+    }
@@ -1,5 +1,25 @@
-from sqlalchemy import create_engine, ForeignKey
+import os
+import math
+import logging
+import sqlite3
+import threading
+from typing import Callable
+from sqlalchemy import (
+    create_engine,
+    delete,
+    event,
+    exc,
+    select,
+    text,
+    DDL,
+    Engine,
+    ForeignKey,
+    UniqueConstraint
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import (
+    Session,
     sessionmaker,
     DeclarativeBase,
     Mapped,
@@ -8,7 +28,19 @@ from sqlalchemy.orm import (
     backref
 )
 
-DATABASE_URL = "sqlite:///db.sqlite"
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///db.sqlite")
+# Survey locations and species locations can optionally be partitioned into shards by
+# geographic grid cell, each with its own database. Sharding is enabled by setting
+# SHARD_GRID_DEGREES to the size of the grid cells in degrees.
+SHARD_GRID_DEGREES = float(os.environ.get("SHARD_GRID_DEGREES") or 0) or None
+SHARD_DATABASE_URL = os.environ.get(
+    "SHARD_DATABASE_URL",
+    "sqlite:///db.shard_{latitude_cell}_{longitude_cell}.sqlite"
+)
+# Each shard allocates ids from its own range, so ids are unique across shards
+SHARD_ID_BITS = 40
+
+logger = logging.getLogger(__name__)
 
 engine = create_engine(
     DATABASE_URL,
@@ -16,6 +48,62 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """
+    Enable foreign key enforcement (and so ON DELETE CASCADE) for SQLite connections,
+    which SQLite leaves disabled by default.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_write_ahead_log(dbapi_connection, connection_record):
+    """
+    Use write-ahead logging for SQLite databases, so that reads can continue
+    while a long write transaction such as an import is in progress.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+# Coordinates are stored as fixed-point integers in millionths of a degree (microdegrees)
+COORDINATE_SCALE = 1_000_000
+COORDINATE_KEY_OFFSET = 2**31
+
+def quantize_coordinate(value: float | str) -> int:
+    """
+    Convert a latitude or longitude in degrees to an integer number of microdegrees.
+
+    Raises a ValueError if the value is not a finite number.
+    """
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"Coordinate {value!r} is not a finite number")
+    return round(value * COORDINATE_SCALE)
+
+def pack_coordinates(latitude_e6: int, longitude_e6: int) -> int:
+    """
+    Pack a quantized latitude and longitude into a single integer key.
+
+    Keys are ordered by latitude and then by longitude, so all locations
+    within a band of latitudes fall in one contiguous range of keys.
+    """
+    return (latitude_e6 << 32) + longitude_e6 + COORDINATE_KEY_OFFSET
+
+def coordinates_key_range(min_latitude_e6: int, max_latitude_e6: int) -> tuple[int, int]:
+    """
+    Return the smallest and largest coordinates keys for locations
+    with a quantized latitude between the given values (inclusive).
+    """
+    return (
+        pack_coordinates(min_latitude_e6, -COORDINATE_KEY_OFFSET),
+        pack_coordinates(max_latitude_e6, COORDINATE_KEY_OFFSET - 1)
+    )
+
 #
 # Database schema
 #
@@ -24,11 +112,48 @@ class Base(DeclarativeBase):
 
 class SurveyLocationDB(Base):
     __tablename__ = "surveylocation"
+    # Ids are never reused, and can start from a shard's own id range
+    __table_args__ = dict(sqlite_autoincrement=True)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     locality: Mapped[str] = mapped_column(nullable=True, default=None)
-    latitude: Mapped[float] = mapped_column(index=True)
-    longitude: Mapped[float] = mapped_column(index=True)
+    latitude_e6: Mapped[int]
+    longitude_e6: Mapped[int]
+    coordinates_key: Mapped[int] = mapped_column(index=True)
+    coordinate_uncertainty_in_meters: Mapped[float] = mapped_column(nullable=True, default=None, index=True)
+    footprint_wkt: Mapped[str] = mapped_column(nullable=True, default=None)
+
+    @hybrid_property
+    def latitude(self) -> float:
+        return self.latitude_e6 / COORDINATE_SCALE
+
+    @latitude.inplace.setter
+    def _latitude_setter(self, value: float | str) -> None:
+        self.latitude_e6 = quantize_coordinate(value)
+        self._update_coordinates_key()
+
+    @latitude.inplace.expression
+    @classmethod
+    def _latitude_expression(cls):
+        return cls.latitude_e6 / COORDINATE_SCALE
+
+    @hybrid_property
+    def longitude(self) -> float:
+        return self.longitude_e6 / COORDINATE_SCALE
+
+    @longitude.inplace.setter
+    def _longitude_setter(self, value: float | str) -> None:
+        self.longitude_e6 = quantize_coordinate(value)
+        self._update_coordinates_key()
+
+    @longitude.inplace.expression
+    @classmethod
+    def _longitude_expression(cls):
+        return cls.longitude_e6 / COORDINATE_SCALE
+
+    def _update_coordinates_key(self) -> None:
+        if self.latitude_e6 is not None and self.longitude_e6 is not None:
+            self.coordinates_key = pack_coordinates(self.latitude_e6, self.longitude_e6)
 
 class SpeciesDB(Base):
     __tablename__ = "species"
@@ -45,6 +170,7 @@ class SpeciesDB(Base):
 
 class SpeciesLocationDB(Base):
     __tablename__ = "specieslocations"
+    __table_args__ = dict(sqlite_autoincrement=True)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     survey_location_id: Mapped[int] = mapped_column(
@@ -56,13 +182,387 @@ class SpeciesLocationDB(Base):
         index=True
     )
 
+    # Deletes are cascaded by the database, so the ORM doesn't need to load related rows
     survey_location = relationship(
         "SurveyLocationDB",
-        backref=backref("species_locations", cascade="all")
+        backref=backref("species_locations", cascade="all", passive_deletes=True)
     )
     species = relationship(
         "SpeciesDB",
-        backref=backref("species_locations", cascade="all")
+        backref=backref("species_locations", cascade="all", passive_deletes=True)
+    )
+
+class CatalogueCounterDB(Base):
+    __tablename__ = "cataloguecounters"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[int]
+
+class ShardDB(Base):
+    __tablename__ = "shards"
+    __table_args__ = (UniqueConstraint("latitude_cell", "longitude_cell"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    latitude_cell: Mapped[int]
+    longitude_cell: Mapped[int]
+
+# Counters are maintained by database triggers, so they stay correct
+# for every writer (API, import script or plain SQL) without extra queries.
+SPECIES_COUNT_COUNTER = "species_count"
+SURVEY_LOCATION_COUNT_COUNTER = "survey_location_count"
+OBSERVATION_COUNT_COUNTER = "observation_count"
+# Changes whenever a specieslocations row is inserted, updated or deleted. It starts
+# from a random value so a recreated database never reuses an earlier version.
+OBSERVATIONS_VERSION_COUNTER = "observations_version"
+
+def row_count_counter_ddl(counter: str, table: str) -> tuple[str, ...]:
+    """
+    Return DDL statements to seed a counter with the number of rows in a table
+    and keep it up to date as rows are inserted and deleted.
+    """
+    return (
+        f"""
+        INSERT OR IGNORE INTO cataloguecounters (name, value)
+        SELECT '{counter}', count(*) FROM {table}
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {counter}_insert AFTER INSERT ON {table}
+        BEGIN
+            UPDATE cataloguecounters SET value = value + 1 WHERE name = '{counter}';
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {counter}_delete AFTER DELETE ON {table}
+        BEGIN
+            UPDATE cataloguecounters SET value = value - 1 WHERE name = '{counter}';
+        END
+        """,
     )
 
+for ddl in (
+    *row_count_counter_ddl(SPECIES_COUNT_COUNTER, "species"),
+    *row_count_counter_ddl(SURVEY_LOCATION_COUNT_COUNTER, "surveylocation"),
+    *row_count_counter_ddl(OBSERVATION_COUNT_COUNTER, "specieslocations"),
+    f"""
+    INSERT OR IGNORE INTO cataloguecounters (name, value)
+    VALUES ('{OBSERVATIONS_VERSION_COUNTER}', abs(random() >> 16))
+    """,
+    *(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS observations_version_{operation.lower()}
+        AFTER {operation} ON specieslocations
+        BEGIN
+            UPDATE cataloguecounters SET value = value + 1 WHERE name = '{OBSERVATIONS_VERSION_COUNTER}';
+        END
+        """
+        for operation in ("INSERT", "UPDATE", "DELETE")
+    ),
+):
+    event.listen(Base.metadata, "after_create", DDL(ddl))
+
 Base.metadata.create_all(engine)
+
+
+class ShardRouter:
+    """
+    Routes survey locations and species locations to shards by geographic grid cell.
+
+    The shards that exist are recorded in the shards table of the main database.
+    Each shard database has the full schema, with copies of the species
+    observed in it so that its foreign keys and joins work.
+    If grid_degrees is None, sharding is disabled and everything is stored in the main database.
+    """
+    def __init__(self, grid_degrees: float | None = None, database_url: str = SHARD_DATABASE_URL):
+        self.grid_degrees = grid_degrees
+        self.database_url = database_url
+        self._engines: dict[int, Engine] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.grid_degrees is not None
+
+    def cell(self, latitude: float | str, longitude: float | str) -> tuple[int, int]:
+        """
+        Return the (latitude cell, longitude cell) of the grid cell containing a point.
+
+        Cells are found from the quantized coordinates, so a point is always routed to the cell
+        of the coordinates it is stored and matched on.
+        Raises a ValueError if either coordinate is not a finite number.
+        """
+        grid_e6 = quantize_coordinate(self.grid_degrees)
+        return (
+            quantize_coordinate(latitude) // grid_e6,
+            quantize_coordinate(longitude) // grid_e6
+        )
+
+    def find_shards(
+        self,
+        db: Session,
+        min_latitude: float | None = None,
+        max_latitude: float | None = None,
+        min_longitude: float | None = None,
+        max_longitude: float | None = None
+    ) -> list[ShardDB]:
+        """
+        Return the existing shards overlapping the given bounds, or all shards if no bounds are given.
+        """
+        query = db.query(ShardDB).order_by(ShardDB.id)
+        if min_latitude is not None:
+            min_latitude_cell, min_longitude_cell = self.cell(min_latitude, min_longitude)
+            max_latitude_cell, max_longitude_cell = self.cell(max_latitude, max_longitude)
+            query = query.filter(
+                ShardDB.latitude_cell.between(min_latitude_cell, max_latitude_cell),
+                ShardDB.longitude_cell.between(min_longitude_cell, max_longitude_cell)
+            )
+        return query.all()
+
+    def find_or_create_shard(self, db: Session, latitude: float, longitude: float) -> ShardDB:
+        """
+        Return the shard for the grid cell containing a point, creating it if it doesn't exist.
+
+        New shards are recorded in the main database in a separate transaction,
+        so the caller's transaction is not committed.
+        """
+        latitude_cell, longitude_cell = self.cell(latitude, longitude)
+        with self._lock, Session(db.get_bind(), expire_on_commit=False) as registry:
+            query = registry.query(ShardDB).filter_by(
+                latitude_cell=latitude_cell,
+                longitude_cell=longitude_cell
+            )
+            shard = query.one_or_none()
+            if not shard:
+                try:
+                    shard = ShardDB(latitude_cell=latitude_cell, longitude_cell=longitude_cell)
+                    registry.add(shard)
+                    registry.commit()
+                except exc.IntegrityError:
+                    # Shard was created by another process at the same time
+                    registry.rollback()
+                    shard = query.one()
+            return shard
+
+    def engine(self, shard: ShardDB) -> Engine:
+        """
+        Return the engine for a shard's database, creating the database if it doesn't exist.
+        """
+        with self._lock:
+            if shard.id not in self._engines:
+                engine = create_engine(
+                    self.database_url.format(
+                        latitude_cell=shard.latitude_cell,
+                        longitude_cell=shard.longitude_cell
+                    ),
+                    connect_args=dict(check_same_thread=False)
+                )
+                Base.metadata.create_all(engine)
+                # Start the shard's ids from its own range
+                with engine.begin() as connection:
+                    for table in (SurveyLocationDB.__tablename__, SpeciesLocationDB.__tablename__):
+                        connection.execute(
+                            text(
+                                "INSERT INTO sqlite_sequence (name, seq) SELECT :table, :seq "
+                                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :table)"
+                            ),
+                            dict(table=table, seq=shard.id << SHARD_ID_BITS)
+                        )
+                self._engines[shard.id] = engine
+            return self._engines[shard.id]
+
+
+def restore_rows(db: Session, model: type[Base], rows: list[dict]):
+    """
+    Insert rows of a table, replacing the values of any rows that already exist.
+    """
+    table = model.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={column.name: statement.excluded[column.name] for column in table.columns}
+    )
+    db.execute(statement, rows)
+
+
+class ShardSessions:
+    """
+    Sessions on the databases holding survey locations and species locations,
+    opened as they are needed.
+
+    If sharding is disabled, the main database session is used for everything.
+    """
+    def __init__(self, db: Session, router: ShardRouter):
+        self.db = db
+        self.router = router
+        self._sessions: dict[int, Session] = {}
+        # Shards already found for each grid cell, so writes don't look them up for every row
+        self._cells: dict[tuple[int, int], ShardDB] = {}
+        # Range of ids of the survey locations and species locations inserted in each session
+        self._inserted: dict[Session, dict[type[Base], tuple[int, int]]] = {}
+        # Functions that undo the other changes made in each shard session
+        self._undo: dict[Session, list[Callable[[Session], None]]] = {}
+        event.listen(db, "after_flush", self._record_inserted)
+
+    @property
+    def enabled(self) -> bool:
+        return self.router.enabled
+
+    def _session(self, shard: ShardDB) -> Session:
+        if shard.id not in self._sessions:
+            session = Session(self.router.engine(shard), expire_on_commit=False)
+            event.listen(session, "after_flush", self._record_inserted)
+            self._sessions[shard.id] = session
+        return self._sessions[shard.id]
+
+    def _record_inserted(self, session: Session, flush_context):
+        # Autoincrement ids only increase, and no other writer can insert into the database until
+        # this session commits, so the rows it inserted are exactly those in its range of ids
+        inserted = self._inserted.setdefault(session, {})
+        for instance in session.new:
+            model = type(instance)
+            if model in (SurveyLocationDB, SpeciesLocationDB):
+                first_id, last_id = inserted.get(model, (instance.id, instance.id))
+                inserted[model] = (min(first_id, instance.id), max(last_id, instance.id))
+
+    def for_point(self, latitude: float, longitude: float) -> Session:
+        """
+        Return a session for writing survey locations at a point, creating its shard if needed.
+        """
+        if not self.enabled:
+            return self.db
+        cell = self.router.cell(latitude, longitude)
+        if cell not in self._cells:
+            self._cells[cell] = self.router.find_or_create_shard(self.db, latitude, longitude)
+        return self._session(self._cells[cell])
+
+    def for_bounds(
+        self,
+        min_latitude: float,
+        max_latitude: float,
+        min_longitude: float,
+        max_longitude: float
+    ) -> list[Session]:
+        """
+        Return sessions for all shards that could hold survey locations within the given bounds.
+        """
+        if not self.enabled:
+            return [self.db]
+        return [
+            self._session(shard) for shard in
+            self.router.find_shards(self.db, min_latitude, max_latitude, min_longitude, max_longitude)
+        ]
+
+    def all(self) -> list[Session]:
+        """
+        Return sessions for all shards.
+        """
+        if not self.enabled:
+            return [self.db]
+        return [self._session(shard) for shard in self.router.find_shards(self.db)]
+
+    def on_undo(self, session: Session, undo: Callable[[Session], None]):
+        """
+        Register a function to undo a change made in a shard session,
+        which is called with the session if the change is committed but the commit is then undone.
+
+        Changes to the main database are rolled back instead, so need no undo.
+        """
+        if session is not self.db:
+            self._undo.setdefault(session, []).append(undo)
+
+    def restore_on_undo(self, session: Session, model: type[Base], *filters):
+        """
+        Save the rows of model matching filters in a shard session, before they are updated or deleted,
+        so they are restored if the commit is undone.
+        """
+        if session is self.db:
+            return
+        rows = [dict(row._mapping) for row in session.execute(select(model.__table__).where(*filters))]
+        if rows:
+            self.on_undo(session, lambda session: restore_rows(session, model, rows))
+
+    def commit(self) -> dict[Session, tuple[int, int]]:
+        """
+        Commit the shard sessions and then the main database session.
+
+        Each shard is a separate database, so they can't all be committed in one transaction.
+        Instead, if a commit fails, the sessions not yet committed are rolled back and
+        the changes already committed to shards are undone, before the error is raised.
+        Every session is flushed before any is committed, so most errors happen before then.
+
+        Returns the range of ids of the species locations inserted in each session.
+        """
+        committed = []
+        try:
+            for session in (*self._sessions.values(), self.db):
+                session.flush()
+            for session in self._sessions.values():
+                session.commit()
+                committed.append(session)
+            self.db.commit()
+            return {
+                session: inserted[SpeciesLocationDB]
+                for session, inserted in self._inserted.items() if SpeciesLocationDB in inserted
+            }
+        except Exception:
+            for session in (*self._sessions.values(), self.db):
+                session.rollback()
+            for session in committed:
+                self._undo_commit(session)
+            raise
+        finally:
+            self._inserted.clear()
+            self._undo.clear()
+
+    def _undo_commit(self, session: Session):
+        """
+        Undo the committed changes of a shard session.
+        """
+        inserted = self._inserted.get(session, {})
+        try:
+            if SpeciesLocationDB in inserted:
+                session.execute(
+                    delete(SpeciesLocationDB).where(SpeciesLocationDB.id.between(*inserted[SpeciesLocationDB]))
+                )
+            if SurveyLocationDB in inserted:
+                # Keep survey locations that other writers have since observed species at
+                session.execute(
+                    delete(SurveyLocationDB).where(
+                        SurveyLocationDB.id.between(*inserted[SurveyLocationDB]),
+                        ~SurveyLocationDB.species_locations.any()
+                    )
+                )
+            # Species are only copied to a shard to be observed there
+            session.execute(delete(SpeciesDB).where(~SpeciesDB.species_locations.any()))
+            for undo in self._undo.get(session, []):
+                undo(session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.exception("Failed to undo changes committed to shard %s", session.get_bind().url)
+
+    def rollback(self):
+        """
+        Roll back the shard sessions and the main database session.
+        """
+        for session in (*self._sessions.values(), self.db):
+            session.rollback()
+        self._inserted.clear()
+        self._undo.clear()
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+        self._inserted.clear()
+        self._undo.clear()
+        if event.contains(self.db, "after_flush", self._record_inserted):
+            event.remove(self.db, "after_flush", self._record_inserted)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+shard_router = ShardRouter(SHARD_GRID_DEGREES)
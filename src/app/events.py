@@ -0,0 +1,119 @@
+import asyncio
+import threading
+from dataclasses import dataclass, field
+
+from .database import quantize_coordinate
+from .schemas import SpeciesLocationEvent
+
+TAXONOMY_FIELDS = ("kingdom", "phylum", "species_class", "order", "family", "genus")
+
+@dataclass(frozen=True)
+class RegionFilter:
+    """
+    Matches survey locations within a bounding box, or within a radius of a point.
+
+    If radius is None, then only survey locations at exactly the given point match.
+    """
+    min_latitude: float | None = None
+    max_latitude: float | None = None
+    min_longitude: float | None = None
+    max_longitude: float | None = None
+    latitude: float | None = None
+    longitude: float | None = None
+    radius: float | None = None
+
+    def matches(self, latitude: float, longitude: float) -> bool:
+        # Compare quantized coordinates, the same as location queries on the database
+        latitude_e6 = quantize_coordinate(latitude)
+        longitude_e6 = quantize_coordinate(longitude)
+        if self.latitude is None:
+            return (
+                quantize_coordinate(self.min_latitude) <= latitude_e6 <= quantize_coordinate(self.max_latitude)
+                and quantize_coordinate(self.min_longitude) <= longitude_e6 <= quantize_coordinate(self.max_longitude)
+            )
+        latitude_distance = latitude_e6 - quantize_coordinate(self.latitude)
+        longitude_distance = longitude_e6 - quantize_coordinate(self.longitude)
+        radius_e6 = quantize_coordinate(abs(self.radius or 0))
+        return latitude_distance**2 + longitude_distance**2 <= radius_e6**2
+
+
+@dataclass(eq=False)
+class Subscription:
+    """
+    Queue of species location events matching a region and taxonomy filter,
+    consumed by a single subscriber running on an event loop.
+    """
+    region: RegionFilter
+    taxonomy: dict[str, str]
+    queue: asyncio.Queue
+    loop: asyncio.AbstractEventLoop
+    dropped: int = field(default=0)
+
+    def matches(self, event: SpeciesLocationEvent) -> bool:
+        return (
+            self.region.matches(event.survey_location.latitude, event.survey_location.longitude)
+            and all(getattr(event.species, field) == value for field, value in self.taxonomy.items())
+        )
+
+    def put(self, event: SpeciesLocationEvent) -> None:
+        # Drop events for subscribers that can't keep up rather than buffering without limit
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self) -> SpeciesLocationEvent:
+        return await self.queue.get()
+
+
+class EventBus:
+    """
+    In-process publish/subscribe bus for species location events.
+
+    Events can be published from any thread, and are delivered to each matching
+    subscriber on the event loop it subscribed from.
+    """
+    def __init__(self, max_queued_events: int = 1000):
+        self.max_queued_events = max_queued_events
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, region: RegionFilter, taxonomy: dict[str, str] | None = None) -> Subscription:
+        """
+        Subscribe to events matching the given filters. Must be called from a running event loop.
+        """
+        subscription = Subscription(
+            region=region,
+            taxonomy=taxonomy or {},
+            queue=asyncio.Queue(maxsize=self.max_queued_events),
+            loop=asyncio.get_running_loop()
+        )
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscribed(self) -> bool:
+        """
+        Whether there are any subscribers, so events need to be published.
+        """
+        with self._lock:
+            return bool(self._subscriptions)
+
+    def publish(self, event: SpeciesLocationEvent) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.put, event)
+                except RuntimeError:
+                    # Subscriber's event loop has been closed
+                    self.unsubscribe(subscription)
+
+
+event_bus = EventBus()
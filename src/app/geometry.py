@@ -0,0 +1,139 @@
+import math
+import re
+import numpy as np
+
+# Approximate length of one degree of latitude in meters
+METERS_PER_DEGREE = 111_320
+# Number of points tested against all edges of a polygon at once, to bound memory use
+POINTS_CHUNK_SIZE = 4096
+
+_RING_PATTERN = re.compile(r"\(([^()]+)\)")
+# Structure of the body of each geometry type: lists of rings, and lists of those. The coordinates
+# within each ring are checked when it is parsed.
+_RING = r"\([^()]+\)"
+_POLYGON = rf"\(\s*{_RING}(?:\s*,\s*{_RING})*\s*\)"
+_MULTIPOLYGON = rf"\(\s*{_POLYGON}(?:\s*,\s*{_POLYGON})*\s*\)"
+_BODY_PATTERNS = dict(POLYGON=re.compile(_POLYGON), MULTIPOLYGON=re.compile(_MULTIPOLYGON))
+
+def parse_wkt_polygon(wkt: str) -> np.ndarray:
+    """
+    Parse a WKT POLYGON or MULTIPOLYGON with coordinates in (longitude latitude) order.
+
+    Returns the edges of all rings (including holes) as an array of
+    (start longitude, start latitude, end longitude, end latitude) rows.
+    Raises a ValueError if the WKT is not a valid polygon, or has coordinates that are
+    not valid longitudes and latitudes.
+    """
+    geometry_type, parenthesis, body = wkt.strip().partition("(")
+    geometry_type = geometry_type.strip().upper()
+    if geometry_type not in _BODY_PATTERNS:
+        raise ValueError(f"Unsupported geometry type {geometry_type or wkt!r}, expected POLYGON or MULTIPOLYGON")
+    body = parenthesis + body
+    if not _BODY_PATTERNS[geometry_type].fullmatch(body):
+        raise ValueError(f"Invalid {geometry_type} rings {body!r}")
+    rings = _RING_PATTERN.findall(body)
+    edges = []
+    for ring in rings:
+        try:
+            points = np.array(
+                [[float(v) for v in point.split()] for point in ring.split(",")],
+                dtype=np.float64
+            )
+        except ValueError:
+            raise ValueError(f"Invalid polygon coordinates {ring!r}")
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 4:
+            raise ValueError(f"Polygon ring must have at least 4 (longitude latitude) points: {ring!r}")
+        if not np.array_equal(points[0], points[-1]):
+            raise ValueError(f"Polygon ring is not closed: {ring!r}")
+        if not (
+            np.all(np.abs(points[:, 0]) <= 180) and np.all(np.abs(points[:, 1]) <= 90)
+        ):
+            raise ValueError(f"Polygon ring has invalid (longitude latitude) coordinates: {ring!r}")
+        edges.append(np.hstack((points[:-1], points[1:])))
+    return np.vstack(edges)
+
+
+def bounding_box_edges(
+    min_latitude: float,
+    max_latitude: float,
+    min_longitude: float,
+    max_longitude: float
+) -> np.ndarray:
+    """
+    Return the edges of a bounding box in the same format as parse_wkt_polygon.
+    """
+    corners = np.array([
+        (min_longitude, min_latitude),
+        (max_longitude, min_latitude),
+        (max_longitude, max_latitude),
+        (min_longitude, max_latitude),
+        (min_longitude, min_latitude),
+    ], dtype=np.float64)
+    return np.hstack((corners[:-1], corners[1:]))
+
+
+def edges_bounds(edges: np.ndarray) -> tuple[float, float, float, float]:
+    """
+    Return the (min latitude, max latitude, min longitude, max longitude) of polygon edges.
+    """
+    return (
+        float(edges[:, [1, 3]].min()),
+        float(edges[:, [1, 3]].max()),
+        float(edges[:, [0, 2]].min()),
+        float(edges[:, [0, 2]].max())
+    )
+
+
+def points_in_polygon(longitudes: np.ndarray, latitudes: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Return a boolean array of whether each point is inside the polygon with the given edges.
+
+    Uses the even-odd rule, counting the edges crossed by a ray from each point,
+    so holes and multiple polygons are handled without distinguishing their rings.
+    """
+    inside = np.zeros(len(longitudes), dtype=bool)
+    x1, y1, x2, y2 = edges.T
+    for start in range(0, len(longitudes), POINTS_CHUNK_SIZE):
+        x = longitudes[start:start + POINTS_CHUNK_SIZE, np.newaxis]
+        y = latitudes[start:start + POINTS_CHUNK_SIZE, np.newaxis]
+        # Edges that straddle each point's latitude, and where they cross that latitude
+        straddles = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_longitude = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        crossings = straddles & (x < crossing_longitude)
+        inside[start:start + POINTS_CHUNK_SIZE] = crossings.sum(axis=1) % 2 == 1
+    return inside
+
+
+def distances_to_edges(longitudes: np.ndarray, latitudes: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Return the approximate distance in meters from each point to the nearest polygon edge.
+
+    Each point and the edges are projected onto a flat plane around the point,
+    which is accurate for the short distances of coordinate uncertainties.
+    """
+    distances = np.empty(len(longitudes), dtype=np.float64)
+    x1, y1, x2, y2 = edges.T
+    for start in range(0, len(longitudes), POINTS_CHUNK_SIZE):
+        x = longitudes[start:start + POINTS_CHUNK_SIZE, np.newaxis]
+        y = latitudes[start:start + POINTS_CHUNK_SIZE, np.newaxis]
+        scale = np.cos(np.radians(y))
+        # Edge start and end relative to each point, in meters
+        ax, ay = (x1 - x) * scale * METERS_PER_DEGREE, (y1 - y) * METERS_PER_DEGREE
+        bx, by = (x2 - x) * scale * METERS_PER_DEGREE, (y2 - y) * METERS_PER_DEGREE
+        dx, dy = bx - ax, by - ay
+        length_squared = dx**2 + dy**2
+        # Position along each edge of the point nearest the origin, clamped to the edge
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(np.where(length_squared > 0, -(ax * dx + ay * dy) / length_squared, 0), 0, 1)
+        distances[start:start + POINTS_CHUNK_SIZE] = np.hypot(ax + t * dx, ay + t * dy).min(axis=1)
+    return distances
+
+
+def meters_to_degrees(meters: float, latitude: float) -> tuple[float, float]:
+    """
+    Return the (latitude, longitude) extent in degrees of a distance in meters at the given latitude.
+    """
+    latitude_degrees = meters / METERS_PER_DEGREE
+    scale = math.cos(math.radians(min(abs(latitude), 89.9)))
+    return latitude_degrees, latitude_degrees / scale
@@ -0,0 +1,313 @@
+import csv
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Literal
+from sqlalchemy.orm import Session, sessionmaker, joinedload
+
+from .database import SpeciesDB, SpeciesLocationDB, ShardRouter, ShardSessions
+from .events import event_bus
+from .schemas import SpeciesLocationEvent
+from .utils import find_or_create_survey_location, find_or_create_species, find_or_copy_species
+from .validation import validate_header, validate_line
+
+ImportJobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+# Maximum number of bytes decompressed from a gzip compressed upload at once
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """
+    Raised when an upload is larger than the maximum size allowed.
+    """
+
+
+def import_rows(
+    rows: Iterable[dict[str, str]],
+    db: Session,
+    shards: ShardSessions,
+    progress: Callable[[int], None] | None = None
+) -> int:
+    """
+    Adds rows of species survey data to the database (but does not commit them).
+
+    If sharding is enabled, each row is added to the shard covering its coordinates,
+    and the species are then added to the main database.
+    progress is called with the number of rows added so far after each row.
+    Returns the number of rows added.
+    """
+    row_count = 0
+    # Distinct species of the imported rows, which are copied to the main database once each
+    imported_species: dict[int, SpeciesDB] = {}
+    for row in rows:
+        shard = shards.for_point(row["decimalLatitude"], row["decimalLongitude"])
+        survey_location = find_or_create_survey_location(
+            shard,
+            latitude=row["decimalLatitude"],
+            longitude=row["decimalLongitude"],
+            locality=row["locality"],
+            coordinate_uncertainty_in_meters=(
+                float(row["coordinateUncertaintyInMeters"])
+                if row["coordinateUncertaintyInMeters"] else None
+            ),
+            footprint_wkt=row["footprintWKT"] or None
+        )
+        species = find_or_create_species(
+            shard,
+            id=row["scientificNameID"],
+            name=row["scientificName"],
+            kingdom=row["kingdom"],
+            phylum=row["phylum"],
+            species_class=row["class"],
+            order=row["order_"],
+            family=row["family"],
+            genus=row["genus"],
+            scientific_name_authorship=row["scientificNameAuthorship"]
+        )
+        shard.flush()
+        imported_species.setdefault(species.id, species)
+        species_location = SpeciesLocationDB(
+            survey_location_id=survey_location.id,
+            species_id=species.id
+        )
+        shard.add(species_location)
+        row_count += 1
+        if progress:
+            progress(row_count)
+    if shards.enabled:
+        # Species are only written to the main database once all rows have been routed,
+        # so it isn't locked while new shards are being registered in it
+        for species in imported_species.values():
+            find_or_copy_species(db, species)
+    return row_count
+
+
+def publish_species_locations(inserted: dict[Session, tuple[int, int]], batch_size: int = 1000):
+    """
+    Publish an event for each committed species location in the given range of ids in each session.
+    """
+    if not event_bus.subscribed:
+        return
+    for db, (first_id, last_id) in inserted.items():
+        query = (
+            db.query(SpeciesLocationDB)
+            .options(joinedload(SpeciesLocationDB.species), joinedload(SpeciesLocationDB.survey_location))
+            .filter(SpeciesLocationDB.id.between(first_id, last_id))
+            .order_by(SpeciesLocationDB.id)
+        )
+        for species_location in query.yield_per(batch_size):
+            event_bus.publish(
+                SpeciesLocationEvent(
+                    id=species_location.id,
+                    species=species_location.species,
+                    survey_location=species_location.survey_location
+                )
+            )
+
+
+class UploadSpool:
+    """
+    Writes a file of species survey data uploaded in chunks to a temporary file,
+    validating each line as it arrives so that the upload is never held in memory.
+
+    Lines are numbered from 1 for the header. Rows must not contain line breaks.
+    If max_size is given, uploads larger than max_size bytes (after decompression) are rejected.
+    """
+    def __init__(
+        self,
+        gzip: bool = False,
+        max_errors: int = 100,
+        max_size: int | None = None,
+        directory: str | None = None
+    ):
+        self.max_errors = max_errors
+        self.max_size = max_size
+        self.size = 0
+        self.columns: list[str] | None = None
+        self.header_valid = True
+        self.line_count = 0
+        self.row_count = 0
+        self.errors: list[tuple[int, str]] = []
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzip else None
+        self._partial_line = b""
+        self._file = tempfile.NamedTemporaryFile("wb", suffix=".csv", dir=directory, delete=False)
+
+    @property
+    def filepath(self) -> str:
+        return self._file.name
+
+    @property
+    def full(self) -> bool:
+        """
+        Whether the maximum number of errors has been found, or the header is invalid
+        so rows can't be validated, so the rest of the upload need not be read.
+        """
+        return not self.header_valid or len(self.errors) >= self.max_errors
+
+    def write(self, chunk: bytes):
+        """
+        Write the next chunk of the upload, validating the lines completed by it.
+
+        Raises a ValueError if a gzip compressed upload can't be decompressed,
+        or an UploadTooLargeError if the upload is larger than max_size.
+        """
+        if not self._decompressor:
+            self._write(chunk)
+            return
+        # Decompress a piece at a time, so a small chunk that expands to a lot of data
+        # is never held in memory all at once
+        while not self.full:
+            try:
+                data = self._decompressor.decompress(chunk, DECOMPRESS_CHUNK_SIZE)
+            except zlib.error as err:
+                raise ValueError(f"Invalid gzip data: {err}")
+            self._write(data)
+            if len(data) < DECOMPRESS_CHUNK_SIZE:
+                break
+            chunk = self._decompressor.unconsumed_tail
+
+    def close(self):
+        """
+        Validate the last line of the upload and close the temporary file.
+        """
+        # The rest of an upload with too many errors isn't read, so its compressed data is left unfinished
+        if self._decompressor and not self._decompressor.eof and not self.full:
+            raise ValueError("Invalid gzip data: upload ended before the end of the compressed data")
+        if self._partial_line:
+            self._validate_line(self._partial_line)
+            self._partial_line = b""
+        if self.columns is None:
+            self.errors.append((1, "file is empty"))
+        self._file.close()
+
+    def discard(self):
+        """
+        Close and delete the temporary file.
+        """
+        self._file.close()
+        os.remove(self.filepath)
+
+    def _write(self, data: bytes):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLargeError(f"Upload is larger than the limit of {self.max_size} bytes")
+        self._file.write(data)
+        lines = (self._partial_line + data).split(b"\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._validate_line(line)
+
+    def _validate_line(self, line: bytes):
+        self.line_count += 1
+        if self.full:
+            return
+        if self.columns is None:
+            self.columns, errors = validate_header(line)
+            self.header_valid = not errors
+        else:
+            errors = validate_line(self.columns, line)
+            if line.strip():
+                self.row_count += 1
+        self.errors.extend((self.line_count, error) for error in errors[:self.max_errors - len(self.errors)])
+
+
+@dataclass(eq=False)
+class ImportJob:
+    """
+    Import of an uploaded file of species survey data, run in the background.
+    """
+    filepath: str
+    rows_total: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: ImportJobStatus = "queued"
+    rows_processed: int = 0
+    error: str | None = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if not self.started_at:
+            return None
+        elapsed = ((self.finished_at or datetime.now(timezone.utc)) - self.started_at).total_seconds()
+        return self.rows_processed / elapsed if elapsed > 0 else None
+
+
+class ImportJobManager:
+    """
+    Runs import jobs on a pool of background worker threads, and keeps track of their status.
+
+    SQLite allows one writer at a time, so by default imports are run one after another.
+    Only the most recent max_finished_jobs finished jobs are kept.
+    """
+    def __init__(self, max_workers: int = 1, max_finished_jobs: int = 100):
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="import")
+        self._jobs: OrderedDict[str, ImportJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        filepath: str,
+        rows_total: int,
+        session_factory: sessionmaker,
+        router: ShardRouter
+    ) -> ImportJob:
+        """
+        Queue an import of the file at filepath, which is deleted once the import has finished.
+        """
+        job = ImportJob(filepath=filepath, rows_total=rows_total)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, session_factory, router)
+        return job
+
+    def get(self, job_id: str) -> ImportJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: ImportJob, session_factory: sessionmaker, router: ShardRouter):
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            with (
+                session_factory() as db,
+                ShardSessions(db, router) as shards,
+                open(job.filepath, encoding="utf-8-sig") as f
+            ):
+                import_rows(
+                    csv.DictReader(f),
+                    db,
+                    shards,
+                    progress=lambda rows: setattr(job, "rows_processed", rows)
+                )
+                # Changes already committed to shards are undone if a later commit fails
+                inserted = shards.commit()
+                job.status = "succeeded"
+                # Subscribers are only sent the imported species locations once they are committed
+                publish_species_locations(inserted)
+        except Exception as err:
+            # Uncommitted changes are rolled back when the sessions are closed
+            job.error = str(err)
+            if job.status != "succeeded":
+                job.status = "failed"
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            os.remove(job.filepath)
+
+    def _prune(self):
+        finished = [id for id, job in self._jobs.items() if job.finished_at]
+        for id in finished[:max(len(finished) - self.max_finished_jobs, 0)]:
+            del self._jobs[id]
+
+
+import_jobs = ImportJobManager()
@@ -1,8 +1,13 @@
-from pydantic import BaseModel
-from typing import Generic, TypeVar
+from datetime import datetime
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, Generic, Literal, TypeVar
 
 DataT = TypeVar('DataT')
 
+# Coordinates in degrees, which must be valid latitudes and longitudes
+Latitude = Annotated[float, Field(ge=-90, le=90, allow_inf_nan=False)]
+Longitude = Annotated[float, Field(ge=-180, le=180, allow_inf_nan=False)]
+
 class PaginatedResponse(BaseModel, Generic[DataT]):
     page: int
     page_size: int
@@ -22,6 +27,12 @@ class Species(BaseModel):
 
     model_config = dict(from_attributes=True)
 
+class SpeciesCount(BaseModel):
+    count: int
+
+class SpeciesDeleted(BaseModel):
+    deleted_count: int
+
 class SpeciesPatch(BaseModel):
     name: str
 
@@ -30,14 +41,81 @@ class SurveyLocation(BaseModel):
     latitude: float
     longitude: float
     locality: str | None
+    coordinate_uncertainty_in_meters: float | None = None
+    footprint_wkt: str | None = None
 
     model_config = dict(from_attributes=True)
 
 class SpeciesLocationCreate(BaseModel):
-    latitude: float
-    longitude: float
+    latitude: Latitude
+    longitude: Longitude
 
 class SpeciesLocationResponse(BaseModel):
     species: Species
     survey_location: SurveyLocation
 
+class BoundingBox(BaseModel):
+    min_latitude: Latitude
+    max_latitude: Latitude
+    min_longitude: Longitude
+    max_longitude: Longitude
+
+    @model_validator(mode="after")
+    def check_bounds_ordered(self) -> "BoundingBox":
+        if self.min_latitude > self.max_latitude:
+            raise ValueError("min_latitude must not be greater than max_latitude")
+        if self.min_longitude > self.max_longitude:
+            raise ValueError("min_longitude must not be greater than max_longitude")
+        return self
+
+class AreaQuery(BaseModel):
+    bounding_box: BoundingBox | None = None
+    wkt: str | None = None
+    include_uncertainty: bool = False
+
+class SpeciesLocationEvent(BaseModel):
+    id: int
+    species: Species
+    survey_location: SurveyLocation
+
+
+class SpeciesLocations(BaseModel):
+    scientific_name_id: int
+    found: bool
+    locations: list[SurveyLocation] | None = None
+    locations_count: int | None = None
+
+class SpeciesCooccurrence(BaseModel):
+    species: Species
+    shared_locations: int
+    jaccard: float
+
+class SpeciesPairCooccurrence(BaseModel):
+    species: tuple[Species, Species]
+    shared_locations: int
+    jaccard: float
+
+class AdmissionMetrics(BaseModel):
+    active: int
+    queued: int
+    admitted: int
+    shed_over_budget: int
+    shed_queue_full: int
+    shed_timeout: int
+
+class ImportJobResponse(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    rows_total: int
+    rows_processed: int
+    rows_per_second: float | None
+    error: str | None
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+
+    model_config = dict(from_attributes=True)
+
+class ImportRowError(BaseModel):
+    line: int
+    message: str
@@ -1,30 +1,59 @@
+from typing import Iterable, Iterator, Sequence
+import numpy as np
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.orm import Session
-from .database import SurveyLocationDB, SpeciesDB
+from .database import (
+    ShardSessions,
+    SurveyLocationDB,
+    SpeciesDB,
+    SpeciesLocationDB,
+    CatalogueCounterDB,
+    SPECIES_COUNT_COUNTER,
+    COORDINATE_SCALE,
+    quantize_coordinate,
+    pack_coordinates,
+    coordinates_key_range
+)
+from .geometry import edges_bounds, points_in_polygon, distances_to_edges, meters_to_degrees
+from .validation import parse_scientific_name_id
+
+# Maximum number of values bound to a single SQL IN clause
+MAX_IN_CLAUSE_SIZE = 500
 
 def find_or_create_survey_location(
     db: Session,
-    latitude: float,
-    longitude: float,
-    locality: str | None = None
+    latitude: float | str,
+    longitude: float | str,
+    locality: str | None = None,
+    coordinate_uncertainty_in_meters: float | None = None,
+    footprint_wkt: str | None = None
 ) -> SurveyLocationDB:
     """
     Search for an entry in surveylocation table with given latitude and longitude.
 
+    Coordinates are quantized to microdegrees before searching, so coordinates
+    that differ only by float rounding match the same entry.
+
     If an existing entry is found, then it is returned.
 
     If no existing entry is found then a new entry to the surveylocation table
     is created(but not committed).
     """
+    coordinates_key = pack_coordinates(
+        quantize_coordinate(latitude),
+        quantize_coordinate(longitude)
+    )
     survey_location = db.query(SurveyLocationDB).filter(
-        SurveyLocationDB.latitude == latitude,
-        SurveyLocationDB.longitude == longitude
+        SurveyLocationDB.coordinates_key == coordinates_key
     ).one_or_none()
     if not survey_location:
         # Add location to db
         survey_location = SurveyLocationDB(
             latitude=latitude,
             longitude=longitude,
-            locality=locality
+            locality=locality,
+            coordinate_uncertainty_in_meters=coordinate_uncertainty_in_meters,
+            footprint_wkt=footprint_wkt
         )
         db.add(survey_location)
     return survey_location
@@ -49,13 +78,7 @@ def find_or_create_species(
     If no existing entry is found then a new entry to the species table
     is created (but not committed).
     """
-    # Check id field is valid integer
-    try:
-        id = int(id)
-    except ValueError:
-        # If not a valid integer, integer id can be at end of colon-delimited string
-        id = int(id.split(':')[-1])
-
+    id = parse_scientific_name_id(id)
     species: SpeciesDB | None = db.get(SpeciesDB, id)
     if not species:
         species = SpeciesDB(
@@ -72,3 +95,164 @@ def find_or_create_species(
         db.add(species)
     return species
 
+def find_or_copy_species(db: Session, species: SpeciesDB) -> SpeciesDB:
+    """
+    Search for an entry in the species table of a shard database with the id of the given species.
+
+    If an existing entry is found, then it is returned.
+
+    If no existing entry is found then a copy of the species is added
+    to the species table (but not committed). Copies that haven't been flushed
+    aren't found, so each species should only be copied once before flushing.
+    """
+    shard_species: SpeciesDB | None = db.get(SpeciesDB, species.id)
+    if not shard_species:
+        shard_species = SpeciesDB(**{
+            column.key: getattr(species, column.key) for column in SpeciesDB.__table__.columns
+        })
+        db.add(shard_species)
+    return shard_species
+
+def delete_species_from_shards(shards: ShardSessions, *filters) -> None:
+    """
+    Delete the copies of species matching filters, and their species locations, from every shard
+    (but do not commit). The deleted rows are restored if the commit is undone.
+    """
+    if not shards.enabled:
+        return
+    for shard in shards.all():
+        shards.restore_on_undo(shard, SpeciesDB, *filters)
+        shards.restore_on_undo(
+            shard,
+            SpeciesLocationDB,
+            SpeciesLocationDB.species_id.in_(select(SpeciesDB.id).where(*filters))
+        )
+        # Locations of the species are deleted by the database's ON DELETE CASCADE
+        shard.execute(delete(SpeciesDB).where(*filters))
+
+def update_species_in_shards(shards: ShardSessions, species_id: int, values: dict) -> None:
+    """
+    Update the copies of a species in every shard (but do not commit).
+    The previous values are restored if the commit is undone.
+    """
+    if not shards.enabled:
+        return
+    for shard in shards.all():
+        shards.restore_on_undo(shard, SpeciesDB, SpeciesDB.id == species_id)
+        shard.execute(update(SpeciesDB).where(SpeciesDB.id == species_id).values(**values))
+
+def batched(values: Sequence[int], size: int = MAX_IN_CLAUSE_SIZE) -> Iterator[Sequence[int]]:
+    """
+    Split values into batches small enough to bind to a single SQL IN clause.
+    """
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def get_species_by_ids(db: Session, species_ids: Iterable[int]) -> dict[int, SpeciesDB]:
+    """
+    Return the entries in the species table with the given ids, by id.
+    """
+    species = {}
+    for ids in batched(list(species_ids)):
+        species.update((s.id, s) for s in db.query(SpeciesDB).filter(SpeciesDB.id.in_(ids)))
+    return species
+
+def get_species_count(db: Session, exact: bool = False) -> int:
+    """
+    Return the number of entries in the species table.
+
+    By default the count is read from the counter maintained by database triggers.
+    If exact is true, the species table is counted instead.
+    """
+    if exact:
+        return db.query(SpeciesDB).count()
+    return db.get(CatalogueCounterDB, SPECIES_COUNT_COUNTER).value
+
+def area_query_bounds(
+    db: Session,
+    edges: np.ndarray,
+    include_uncertainty: bool = False
+) -> tuple[float, float, float, float]:
+    """
+    Return the (min latitude, max latitude, min longitude, max longitude) of the survey locations
+    that need to be checked to find those inside the polygon with the given edges.
+
+    If include_uncertainty is true, the bounds are widened by the largest coordinate uncertainty,
+    so they include locations whose circle of uncertainty reaches into the polygon.
+    """
+    min_latitude, max_latitude, min_longitude, max_longitude = edges_bounds(edges)
+    if include_uncertainty:
+        max_uncertainty = db.query(func.max(SurveyLocationDB.coordinate_uncertainty_in_meters)).scalar() or 0
+        latitude_margin, _ = meters_to_degrees(max_uncertainty, 0)
+        # Degrees of longitude are shortest at the latitude furthest from the equator
+        _, longitude_margin = meters_to_degrees(
+            max_uncertainty,
+            max(abs(min_latitude), abs(max_latitude)) + latitude_margin
+        )
+        min_latitude, max_latitude = min_latitude - latitude_margin, max_latitude + latitude_margin
+        min_longitude, max_longitude = min_longitude - longitude_margin, max_longitude + longitude_margin
+    return min_latitude, max_latitude, min_longitude, max_longitude
+
+def get_species_ids_in_area(
+    db: Session,
+    edges: np.ndarray,
+    include_uncertainty: bool = False,
+    is_bounding_box: bool = False
+) -> list[int]:
+    """
+    Return the ids of all species observed at survey locations inside the polygon
+    with the given edges, in the order they were first observed.
+
+    If include_uncertainty is true, survey locations whose circle of coordinate
+    uncertainty intersects the polygon are also included.
+
+    If is_bounding_box is true, the edges are those of a bounding box,
+    and locations on its boundary are included.
+    """
+    min_latitude, max_latitude, min_longitude, max_longitude = area_query_bounds(db, edges, include_uncertainty)
+    # Find observations in the bounding box using the coordinates key index
+    min_key, max_key = coordinates_key_range(
+        quantize_coordinate(min_latitude),
+        quantize_coordinate(max_latitude)
+    )
+    observations = (
+        db.query(
+            SpeciesLocationDB.species_id,
+            SurveyLocationDB.latitude_e6,
+            SurveyLocationDB.longitude_e6,
+            SurveyLocationDB.coordinate_uncertainty_in_meters
+        )
+        .join(SurveyLocationDB, SpeciesLocationDB.survey_location_id == SurveyLocationDB.id)
+        .filter(
+            SurveyLocationDB.coordinates_key.between(min_key, max_key),
+            SurveyLocationDB.longitude_e6.between(
+                quantize_coordinate(min_longitude),
+                quantize_coordinate(max_longitude)
+            )
+        )
+        .order_by(SpeciesLocationDB.id)
+        .all()
+    )
+    if not observations:
+        return []
+    species_ids, latitudes, longitudes, uncertainties = zip(*observations)
+    species_ids = np.array(species_ids, dtype=np.int64)
+    latitudes = np.array(latitudes, dtype=np.float64) / COORDINATE_SCALE
+    longitudes = np.array(longitudes, dtype=np.float64) / COORDINATE_SCALE
+    uncertainties = np.array(uncertainties, dtype=np.float64)
+    if is_bounding_box:
+        min_latitude, max_latitude, min_longitude, max_longitude = edges_bounds(edges)
+        matches = (
+            (min_latitude <= latitudes) & (latitudes <= max_latitude)
+            & (min_longitude <= longitudes) & (longitudes <= max_longitude)
+        )
+    else:
+        matches = points_in_polygon(longitudes, latitudes, edges)
+    if include_uncertainty:
+        # Missing uncertainties are stored as NULL, which becomes nan and never matches
+        uncertain = ~matches & (uncertainties > 0)
+        matches[uncertain] = (
+            distances_to_edges(longitudes[uncertain], latitudes[uncertain], edges)
+            <= uncertainties[uncertain]
+        )
+    return list(dict.fromkeys(species_ids[matches].tolist()))
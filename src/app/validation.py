@@ -0,0 +1,102 @@
+import csv
+import math
+
+REQUIRED_COLUMNS = (
+    "locality",
+    "decimalLatitude",
+    "decimalLongitude",
+    "coordinateUncertaintyInMeters",
+    "footprintWKT",
+    "scientificNameID",
+    "scientificName",
+    "kingdom",
+    "phylum",
+    "class",
+    "order_",
+    "family",
+    "genus",
+    "scientificNameAuthorship"
+)
+
+
+def parse_scientific_name_id(id: str) -> int:
+    """
+    Return the integer species id from a scientific name id,
+    which is either an integer or a colon-delimited string ending in an integer.
+
+    Raises a ValueError if no integer id can be found.
+    """
+    # Check id field is valid integer
+    try:
+        return int(id)
+    except ValueError:
+        # If not a valid integer, integer id can be at end of colon-delimited string
+        return int(id.split(':')[-1])
+
+
+def validate_coordinate(value: str, name: str, limit: float) -> str | None:
+    """
+    Returns an error message if value is not a number between -limit and limit.
+    """
+    try:
+        coordinate = float(value)
+    except ValueError:
+        return f"{name} {value!r} is not a number"
+    if not -limit <= coordinate <= limit:
+        return f"{name} {value!r} is not between {-limit} and {limit}"
+    return None
+
+
+def validate_row(row: dict[str, str]) -> list[str]:
+    """
+    Returns a list of error messages for a row of species survey data, which is empty if the row is valid.
+    """
+    errors = [
+        validate_coordinate(row["decimalLatitude"], "decimalLatitude", 90),
+        validate_coordinate(row["decimalLongitude"], "decimalLongitude", 180),
+    ]
+    try:
+        parse_scientific_name_id(row["scientificNameID"])
+    except ValueError:
+        errors.append(f"scientificNameID {row['scientificNameID']!r} does not contain an integer id")
+    uncertainty = row["coordinateUncertaintyInMeters"]
+    if uncertainty:
+        try:
+            valid_uncertainty = math.isfinite(float(uncertainty)) and float(uncertainty) >= 0
+        except ValueError:
+            valid_uncertainty = False
+        if not valid_uncertainty:
+            errors.append(f"coordinateUncertaintyInMeters {uncertainty!r} is not a non-negative number")
+    return [error for error in errors if error]
+
+
+def validate_header(line: bytes) -> tuple[list[str], list[str]]:
+    """
+    Returns the columns in the header line of a file of species survey data,
+    and a list of error messages which is empty if it has all the required columns.
+    """
+    try:
+        columns = next(csv.reader([line.decode("utf-8-sig")]), [])
+    except (UnicodeDecodeError, csv.Error) as err:
+        return [], [f"unreadable header: {err}"]
+    missing_columns = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing_columns:
+        return columns, [f"missing columns {', '.join(missing_columns)}"]
+    return columns, []
+
+
+def validate_line(columns: list[str], line: bytes) -> list[str]:
+    """
+    Returns a list of error messages for a line of a file of species survey data with the given columns.
+
+    Blank lines are valid, since they are skipped when importing.
+    """
+    try:
+        values = next(csv.reader([line.decode()]), [])
+    except (UnicodeDecodeError, csv.Error) as err:
+        return [f"unreadable row: {err}"]
+    if not values:
+        return []
+    if len(values) != len(columns):
+        return [f"expected {len(columns)} fields but found {len(values)}"]
+    return validate_row(dict(zip(columns, values)))
@@ -9,6 +9,7 @@ import asyncio
 from collections import defaultdict
 
 API_BASE_URL = 'http://127.0.0.1:8000'
+BATCH_SIZE = 1000
 
 async def main():
     """
@@ -53,12 +54,20 @@ async def get_locations_count(species: list[dict]) -> None:
     """
     print("Fetching species location data...")
     async with aiohttp.ClientSession() as session:
-        for s in species:
-            async with session.get(
-                f"{API_BASE_URL}/species/{s['id']}/locations"
+        # Request location counts for many species at once, rather than one request per species
+        for i in range(0, len(species), BATCH_SIZE):
+            batch = species[i:i + BATCH_SIZE]
+            async with session.post(
+                f"{API_BASE_URL}/species/locations/batch",
+                json=dict(
+                    scientific_name_ids=[s["id"] for s in batch],
+                    counts_only=True
+                )
             ) as response:
                 json = await response.json()
-                s.update(locations_count=len(json))
+                counts = {result["scientific_name_id"]: result.get("locations_count", 0) for result in json}
+                for s in batch:
+                    s.update(locations_count=counts[s["id"]])
 
 
 def find_most_observed_species(phyla: dict[list]) -> list[dict]:
@@ -1,64 +1,146 @@
 # Script to import species survey data
 # from a file supplied on the command line
 # into the database.
+#
+# With the --validate option, the file is checked for
+# malformed rows instead, without touching the database.
 
 import sys
+import os
 import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
 from sqlalchemy.orm import Session
 
-from src.app.database import SessionLocal, SpeciesLocationDB
-from src.app.utils import find_or_create_survey_location, find_or_create_species
+# Importing the database module creates the database, so it is only imported
+# when importing data, and --validate never touches the database
+from src.app.validation import validate_header, validate_line
 
+if TYPE_CHECKING:
+    from src.app.database import ShardSessions
 
-def import_data(filepath: str, db: Session):
+# Size in bytes of the parts of the file validated by each worker process
+VALIDATION_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def import_data(filepath: str, db: Session, shards: "ShardSessions | None" = None):
     """
     Adds species survey data contained in given file to the database.
+
+    If sharding is enabled, each row is added to the shard covering its coordinates,
+    and the species are then added to the main database.
     """
+    from src.app.database import ShardSessions, shard_router
+    from src.app.imports import import_rows
+
+    shards = shards or ShardSessions(db, shard_router)
     print(f"Importing species survey data from {filepath} to database...")
     with open(filepath) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            survey_location = find_or_create_survey_location(
-                db,
-                latitude=row["decimalLatitude"],
-                longitude=row["decimalLongitude"],
-                locality=row["locality"]
-            )
-            species = find_or_create_species(
-                db,
-                id=row["scientificNameID"],
-                name=row["scientificName"],
-                kingdom=row["kingdom"],
-                phylum=row["phylum"],
-                species_class=row["class"],
-                order=row["order_"],
-                family=row["family"],
-                genus=row["genus"],
-                scientific_name_authorship=row["scientificNameAuthorship"]
-            )
-            db.flush()
-            species_location = SpeciesLocationDB(
-                survey_location_id=survey_location.id,
-                species_id=species.id
-            )
-            db.add(species_location)
+        import_rows(csv.DictReader(f), db, shards)
+
+
+def validate_chunk(filepath: str, columns: list[str], start: int, end: int) -> tuple[int, list[tuple[int, str]]]:
+    """
+    Validates the rows of the file that start between the given byte offsets.
+
+    Returns the number of rows in the chunk, and a list of (row index within the chunk, error message)
+    for each error found. Rows must not contain line breaks.
+    """
+    errors = []
+    row_count = 0
+    with open(filepath, "rb") as f:
+        # Skip the end of a row that started in the previous chunk
+        f.seek(start - 1)
+        f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            errors.extend((row_count, error) for error in validate_line(columns, line))
+            row_count += 1
+    return row_count, errors
+
+
+def validate_data(
+    filepath: str,
+    processes: int | None = None,
+    chunk_size: int = VALIDATION_CHUNK_SIZE
+) -> list[tuple[int, str]]:
+    """
+    Checks every row of the species survey data in the given file, without touching the database.
+
+    The file is split into chunks of bytes which are validated in parallel by worker processes.
+    Returns a list of (line number, error message) for each error found, in line order.
+    """
+    with open(filepath, "rb") as f:
+        header = f.readline()
+        header_end = f.tell()
+        file_size = f.seek(0, os.SEEK_END)
+    columns, header_errors = validate_header(header)
+    if header_errors:
+        return [(1, error) for error in header_errors]
+
+    chunk_starts = list(range(header_end, file_size, chunk_size))
+    chunk_args = (
+        [filepath] * len(chunk_starts),
+        [columns] * len(chunk_starts),
+        chunk_starts,
+        [min(start + chunk_size, file_size) for start in chunk_starts]
+    )
+    if len(chunk_starts) > 1 and processes != 1:
+        with ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(validate_chunk, *chunk_args))
+    else:
+        results = list(map(validate_chunk, *chunk_args))
+
+    # Convert row indexes within each chunk to line numbers, after the header on line 1
+    errors = []
+    first_line = 2
+    for row_count, chunk_errors in results:
+        errors.extend((first_line + row, error) for row, error in chunk_errors)
+        first_line += row_count
+    return errors
 
 
 def main():
     """
     Imports species survey data to the database from a file supplied as a command line arg.
     """
-    try:
-        filepath = sys.argv[1]
-    except IndexError:
-        print("Missing argument: please supply path to file containing survey data")
-        sys.exit(1)
-    with SessionLocal() as db_session, db_session.begin():
+    parser = argparse.ArgumentParser(description="Import species survey data to the database.")
+    parser.add_argument("filepath", help="path to file containing survey data")
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="check the file for errors without importing it"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="number of worker processes used to validate the file (defaults to the number of CPUs)"
+    )
+    args = parser.parse_args()
+    filepath = args.filepath
+    if args.validate:
+        print(f"Validating species survey data in {filepath}...")
+        errors = validate_data(filepath, args.processes)
+        for line, error in errors:
+            print(f"Line {line}: {error}")
+        if errors:
+            print(f"Found {len(errors)} errors")
+            sys.exit(1)
+        print("No errors found")
+        return
+    from src.app.database import SessionLocal, ShardSessions, shard_router
+
+    with SessionLocal() as db_session, ShardSessions(db_session, shard_router) as shards:
         try:
-            import_data(filepath, db_session)
+            import_data(filepath, db_session, shards)
+            # Changes already committed to shards are undone if a later commit fails
+            shards.commit()
         except Exception as err:
             print(f'Error importing data to database: {err}. Reverting changes')
-            db_session.rollback()
+            shards.rollback()
             sys.exit(1)
 
 
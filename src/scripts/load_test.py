@@ -0,0 +1,263 @@
+# Script to load test the species survey API.
+#
+# Generates a database of random survey data, starts the API
+# against it with uvicorn, then drives a mix of requests from
+# concurrent clients and prints throughput, latency percentiles
+# and error rates for each route as JSON.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+import aiohttp
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from src.app.api import DEFAULT_PAGE_SIZE
+from src.app.database import (
+    Base,
+    SpeciesDB,
+    SurveyLocationDB,
+    SpeciesLocationDB,
+    quantize_coordinate,
+    pack_coordinates
+)
+
+# Survey locations are generated within this region around Fiji
+MIN_LATITUDE, MAX_LATITUDE = -19.0, -15.0
+MIN_LONGITUDE, MAX_LONGITUDE = 177.0, 180.0
+# Relative frequency of each type of request in the workload
+REQUEST_MIX = {
+    "GET /species": 40,
+    "GET /location/species": 25,
+    "GET /species/{id}/locations": 25,
+    "POST /species/{id}/locations": 10,
+}
+SERVER_STARTUP_TIMEOUT = 30
+
+@dataclass
+class Sample:
+    route: str
+    status: int | None
+    latency: float
+
+
+def generate_database(database_url: str, species: int, locations: int, observations: int, seed: int):
+    """
+    Creates a database at the given url filled with random species survey data.
+    """
+    rng = random.Random(seed)
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db, db.begin():
+        db.execute(insert(SpeciesDB), [
+            dict(
+                id=id,
+                name=f"Species {id}",
+                kingdom=f"Kingdom {id % 3}",
+                phylum=f"Phylum {id % 20}",
+                species_class=f"Class {id % 50}",
+                order=f"Order {id % 100}",
+                family=f"Family {id % 200}",
+                genus=f"Genus {id % 500}",
+                scientific_name_authorship="Load test"
+            ) for id in range(1, species + 1)
+        ])
+        survey_locations = []
+        for id in range(1, locations + 1):
+            latitude_e6 = quantize_coordinate(rng.uniform(MIN_LATITUDE, MAX_LATITUDE))
+            longitude_e6 = quantize_coordinate(rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE))
+            survey_locations.append(dict(
+                id=id,
+                latitude_e6=latitude_e6,
+                longitude_e6=longitude_e6,
+                coordinates_key=pack_coordinates(latitude_e6, longitude_e6)
+            ))
+        db.execute(insert(SurveyLocationDB), survey_locations)
+        db.execute(insert(SpeciesLocationDB), [
+            dict(
+                species_id=rng.randint(1, species),
+                survey_location_id=rng.randint(1, locations)
+            ) for _ in range(observations)
+        ])
+    engine.dispose()
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen:
+    """
+    Starts the API with uvicorn in a subprocess, using the database at the given url.
+    """
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "src.app.api:api",
+            "--port", str(port),
+            "--log-level", "warning"
+        ],
+        env=dict(os.environ, DATABASE_URL=database_url)
+    )
+
+
+async def wait_for_server(base_url: str):
+    """
+    Waits until the API responds to requests.
+    """
+    deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{base_url}/species/count") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"API did not start within {SERVER_STARTUP_TIMEOUT} seconds")
+            await asyncio.sleep(0.1)
+
+
+def random_request(rng: random.Random, species: int) -> tuple[str, str, str, dict]:
+    """
+    Returns the route, method, path and request arguments of a random request from the workload.
+    """
+    route = rng.choices(list(REQUEST_MIX), weights=list(REQUEST_MIX.values()))[0]
+    species_id = rng.randint(1, species)
+    if route == "GET /species":
+        page = rng.randint(0, species // DEFAULT_PAGE_SIZE)
+        return route, "GET", "/species", dict(params=dict(page=page))
+    if route == "GET /location/species":
+        return route, "GET", "/location/species", dict(params=dict(
+            latitude=rng.uniform(MIN_LATITUDE, MAX_LATITUDE),
+            longitude=rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE),
+            radius=rng.uniform(0.01, 0.5)
+        ))
+    if route == "GET /species/{id}/locations":
+        return route, "GET", f"/species/{species_id}/locations", {}
+    return route, "POST", f"/species/{species_id}/locations", dict(json=dict(
+        latitude=rng.uniform(MIN_LATITUDE, MAX_LATITUDE),
+        longitude=rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE)
+    ))
+
+
+async def run_client(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    species: int,
+    deadline: float,
+    rng: random.Random,
+    samples: list[Sample]
+):
+    """
+    Sends random requests one after another until the deadline, recording each request's latency.
+    """
+    while time.monotonic() < deadline:
+        route, method, path, kwargs = random_request(rng, species)
+        start = time.perf_counter()
+        try:
+            async with session.request(method, f"{base_url}{path}", **kwargs) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            status = None
+        samples.append(Sample(route, status, time.perf_counter() - start))
+
+
+async def run_load(base_url: str, species: int, clients: int, duration: float, seed: int) -> list[Sample]:
+    """
+    Runs the given number of concurrent clients against the API for the given duration.
+    """
+    samples = []
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(
+            run_client(session, base_url, species, deadline, random.Random(seed + i), samples)
+            for i in range(clients)
+        ))
+    return samples
+
+
+def summarise(samples: list[Sample], duration: float) -> dict:
+    """
+    Returns the throughput, latency percentiles and error rate of the samples for each route
+    and for all routes combined.
+    """
+    routes = defaultdict(list)
+    for sample in samples:
+        routes[sample.route].append(sample)
+        routes["all"].append(sample)
+    summary = {}
+    for route, route_samples in sorted(routes.items()):
+        latencies_ms = np.array([s.latency for s in route_samples]) * 1000
+        status_counts = defaultdict(int)
+        for s in route_samples:
+            status_counts[str(s.status) if s.status else "connection_error"] += 1
+        errors = sum(1 for s in route_samples if not s.status or s.status >= 400)
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        summary[route] = dict(
+            requests=len(route_samples),
+            throughput_rps=len(route_samples) / duration,
+            error_rate=errors / len(route_samples),
+            status_counts=dict(sorted(status_counts.items())),
+            latency_ms=dict(
+                mean=float(latencies_ms.mean()),
+                p50=float(p50),
+                p95=float(p95),
+                p99=float(p99),
+                max=float(latencies_ms.max())
+            )
+        )
+    return summary
+
+
+def main():
+    """
+    Generates a database, starts the API and load tests it with the options supplied on the command line.
+    """
+    parser = argparse.ArgumentParser(description="Load test the species survey API.")
+    parser.add_argument("--species", type=int, default=1000, help="number of species to generate")
+    parser.add_argument("--locations", type=int, default=5000, help="number of survey locations to generate")
+    parser.add_argument("--observations", type=int, default=50000, help="number of species locations to generate")
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run the load test for")
+    parser.add_argument("--port", type=int, default=8001, help="port to run the API on")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for data and requests")
+    parser.add_argument("--output", help="file to write JSON results to, instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = f"sqlite:///{os.path.join(tmp_dir, 'loadtest.sqlite')}"
+        print("Generating database...", file=sys.stderr)
+        generate_database(database_url, args.species, args.locations, args.observations, args.seed)
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(database_url, args.port)
+        try:
+            asyncio.run(wait_for_server(base_url))
+            print(f"Running {args.clients} clients for {args.duration} seconds...", file=sys.stderr)
+            samples = asyncio.run(run_load(base_url, args.species, args.clients, args.duration, args.seed))
+        finally:
+            server.terminate()
+            server.wait()
+
+    results = dict(
+        config=vars(args),
+        routes=summarise(samples, args.duration)
+    )
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import math
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from src.app.admission import AdmissionController, estimate_location_query_cost, estimate_area_query_cost
+from src.app.geometry import bounding_box_edges
+from src.app.api import admission_controllers
+
+from ..conftest import client
+from .helpers import create_species, add_species_location_at_location
+
+
+def test_admission_controller_over_budget():
+    controller = AdmissionController(max_concurrent=1, max_queued=1, timeout=1.0, max_cost=10)
+
+    async def run():
+        async with controller.admit(cost=11):
+            pass
+
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(run())
+    assert err.value.status_code == 429
+    assert controller.metrics["shed_over_budget"] == 1
+    assert controller.active == 0
+
+
+def test_admission_controller_estimates_cost_with_slot():
+    controller = AdmissionController(max_concurrent=1, max_queued=0, timeout=1.0, max_cost=10)
+    estimated = []
+
+    async def estimate_cost():
+        estimated.append(controller.active)
+        return 11
+
+    async def run():
+        async with controller.admit():
+            # Queue is full, so the cost of the second request is never estimated
+            with pytest.raises(HTTPException) as err:
+                async with controller.admit(estimate_cost=estimate_cost):
+                    pass
+            assert err.value.status_code == 503
+        with pytest.raises(HTTPException) as err:
+            async with controller.admit(estimate_cost=estimate_cost):
+                pass
+        assert err.value.status_code == 429
+
+    asyncio.run(run())
+    # The cost is estimated while the request holds a slot, which is then released
+    assert estimated == [1]
+    assert controller.active == 0
+    assert controller.metrics["shed_over_budget"] == 1
+
+
+def test_admission_controller_queueing():
+    controller = AdmissionController(max_concurrent=1, max_queued=1, timeout=0.1)
+    order = []
+
+    async def request(name: str, duration: float):
+        try:
+            async with controller.admit():
+                order.append(name)
+                await asyncio.sleep(duration)
+            return 200
+        except HTTPException as err:
+            return err.status_code
+
+    async def run():
+        first = asyncio.create_task(request("first", 0.05))
+        await asyncio.sleep(0)
+        # Second request waits for the first to finish, third finds the queue full
+        return await asyncio.gather(first, request("second", 0), request("third", 0))
+
+    assert asyncio.run(run()) == [200, 200, 503]
+    assert order == ["first", "second"]
+    assert controller.active == 0
+    assert controller.metrics == dict(
+        admitted=2,
+        shed_over_budget=0,
+        shed_queue_full=1,
+        shed_timeout=0
+    )
+
+
+def test_admission_controller_timeout():
+    controller = AdmissionController(max_concurrent=1, max_queued=1, timeout=0.01)
+
+    async def request(duration: float):
+        try:
+            async with controller.admit():
+                await asyncio.sleep(duration)
+            return 200
+        except HTTPException as err:
+            return err.status_code
+
+    async def run():
+        first = asyncio.create_task(request(0.1))
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, request(0))
+
+    assert asyncio.run(run()) == [200, 503]
+    assert controller.metrics["shed_timeout"] == 1
+    assert controller.active == 0
+    assert controller.queued == 0
+
+
+def test_estimate_location_query_cost(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    assert estimate_location_query_cost([test_db], 0.0, 0.0, 1.0) == 0
+    add_species_location_at_location(s1, 0.0, 0.0, test_db)
+    add_species_location_at_location(s2, 0.5, 0.5, test_db)
+    add_species_location_at_location(s3, 5.0, 5.0, test_db)
+    assert estimate_location_query_cost([test_db], 0.0, 0.0, None) == 1
+    assert estimate_location_query_cost([test_db], 0.0, 0.0, 1.0) == pytest.approx(2 * 3.14159 / 4)
+    # Radius covering every coordinate uses the survey location counter
+    assert estimate_location_query_cost([test_db], 0.0, 0.0, 360) == pytest.approx(3 * math.pi / 4)
+    # Counting stops once the query is known to be over budget
+    cost = estimate_location_query_cost([test_db], 0.0, 0.0, 10.0, max_cost=1)
+    assert cost > 1
+    assert cost == pytest.approx(2 * math.pi / 4)
+
+
+def test_location_query_over_budget(test_db: Session, monkeypatch):
+    s1, s2, _ = create_species(test_db)
+    add_species_location_at_location(s1, 0.0, 0.0, test_db)
+    add_species_location_at_location(s2, 0.5, 0.5, test_db)
+    controller = admission_controllers["/location/species"]
+    monkeypatch.setattr(controller, "max_cost", 1)
+    shed = controller.metrics["shed_over_budget"]
+
+    response = client.get("/location/species?latitude=0.0&longitude=0.0&radius=1.0")
+    assert response.status_code == 429
+    response = client.get("/location/species?latitude=0.0&longitude=0.0")
+    assert response.status_code == 200
+
+    response = client.get("/metrics/admission")
+    assert response.status_code == 200
+    assert response.json()["/location/species"]["shed_over_budget"] == shed + 1
+
+
+def test_estimate_area_query_cost(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    edges = bounding_box_edges(min_latitude=-1, max_latitude=1, min_longitude=-1, max_longitude=1)
+    assert estimate_area_query_cost([test_db], edges) == 0
+    add_species_location_at_location(s1, 0.0, 0.0, test_db)
+    add_species_location_at_location(s2, 0.5, 0.5, test_db)
+    location = add_species_location_at_location(s3, 5.0, 5.0, test_db)
+    assert estimate_area_query_cost([test_db], edges) == 2
+    assert estimate_area_query_cost([test_db], edges, max_cost=0) == 1
+    # A large uncertainty widens the bounds checked by the query
+    location.coordinate_uncertainty_in_meters = 1e12
+    test_db.commit()
+    assert estimate_area_query_cost([test_db], edges, include_uncertainty=True) == 3
+
+
+def test_area_query_over_budget(test_db: Session, monkeypatch):
+    s1, s2, _ = create_species(test_db)
+    add_species_location_at_location(s1, 0.0, 0.0, test_db)
+    add_species_location_at_location(s2, 0.5, 0.5, test_db)
+    controller = admission_controllers["/location/species/area"]
+    monkeypatch.setattr(controller, "max_cost", 1)
+
+    response = client.post(
+        "/location/species/area",
+        json=dict(bounding_box=dict(min_latitude=-1, max_latitude=1, min_longitude=-1, max_longitude=1))
+    )
+    assert response.status_code == 429
+    response = client.post(
+        "/location/species/area",
+        json=dict(bounding_box=dict(min_latitude=-0.1, max_latitude=0.1, min_longitude=-0.1, max_longitude=0.1))
+    )
+    assert response.status_code == 200
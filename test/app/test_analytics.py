@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy.orm import Session
+from src.app.analytics import get_incidence_matrix, species_cooccurrence, top_cooccurring_pairs
+from src.app.database import SpeciesDB, SurveyLocationDB, SpeciesLocationDB
+
+from .helpers import create_species
+
+
+def add_observations(db: Session, observations: list[tuple[SpeciesDB, SurveyLocationDB]]):
+    db.add_all(
+        SpeciesLocationDB(species_id=species.id, survey_location_id=survey_location.id)
+        for species, survey_location in observations
+    )
+    db.commit()
+
+
+@pytest.fixture()
+def observed_species(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    locations = [SurveyLocationDB(latitude=i, longitude=i) for i in range(4)]
+    test_db.add_all(locations)
+    test_db.commit()
+    l1, l2, l3, l4 = locations
+    add_observations(test_db, [
+        (s1, l1), (s2, l1), (s3, l1),
+        (s1, l2), (s2, l2),
+        (s1, l3),
+        (s3, l4), (s3, l4)
+    ])
+    return s1, s2, s3
+
+
+def test_get_incidence_matrix_ok(test_db: Session, observed_species):
+    s1, s2, s3 = observed_species
+    incidence = get_incidence_matrix([test_db])
+    assert list(incidence.species_ids) == sorted([s1.id, s2.id, s3.id])
+    # Duplicate observations at a location are only counted once
+    assert incidence.matrix.sum() == 7
+    assert [incidence.location_counts[incidence.species_index(s.id)] for s in observed_species] == [3, 2, 2]
+    assert incidence.species_index(123) is None
+    # Matrix is cached until the observations change
+    assert get_incidence_matrix([test_db]) is incidence
+    add_observations(test_db, [(s2, test_db.query(SurveyLocationDB).first())])
+    assert get_incidence_matrix([test_db]) is not incidence
+
+
+def test_species_cooccurrence_ok(test_db: Session, observed_species):
+    s1, s2, s3 = observed_species
+    incidence = get_incidence_matrix([test_db])
+    assert species_cooccurrence(incidence, s1.id, "shared_locations", 10) == [
+        (s2.id, 2, 2/3),
+        (s3.id, 1, 1/4)
+    ]
+    assert species_cooccurrence(incidence, s3.id, "shared_locations", 10) == [
+        (s2.id, 1, 1/3),
+        (s1.id, 1, 1/4)
+    ]
+    assert species_cooccurrence(incidence, s3.id, "jaccard", 1) == [(s2.id, 1, 1/3)]
+    assert species_cooccurrence(incidence, 123, "jaccard", 10) == []
+
+
+def test_top_cooccurring_pairs_ok(test_db: Session, observed_species):
+    s1, s2, s3 = observed_species
+    incidence = get_incidence_matrix([test_db])
+    assert top_cooccurring_pairs(incidence, "shared_locations", 10) == [
+        (s1.id, s2.id, 2, 2/3),
+        (s3.id, s2.id, 1, 1/3),
+        (s1.id, s3.id, 1, 1/4)
+    ]
+    assert top_cooccurring_pairs(incidence, "jaccard", 2) == [
+        (s1.id, s2.id, 2, 2/3),
+        (s3.id, s2.id, 1, 1/3)
+    ]
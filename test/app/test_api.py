@@ -1,5 +1,7 @@
 
+import sqlite3
 from fastapi import Response
+from sqlalchemy import exc
 from sqlalchemy.orm import Session
 from src.app.database import SpeciesDB, SurveyLocationDB, SpeciesLocationDB
 from src.app.api import DEFAULT_PAGE_SIZE
@@ -7,6 +9,30 @@ from src.app.api import DEFAULT_PAGE_SIZE
 from ..conftest import client
 from .helpers import create_species, species_response, add_species_location_at_location
 
+#
+# report_species_location tests
+#
+def test_report_species_location_invalid_body(test_db: Session):
+    species, *_ = create_species(test_db)
+    for invalid_body in (
+        dict(latitude=1e9, longitude=10.77),
+        dict(latitude=-16.556, longitude=-181),
+        dict(latitude="nan", longitude=10.77),
+    ):
+        response = client.post(f"/species/{species.id}/locations", json=invalid_body)
+        assert response.status_code == 422
+    assert test_db.query(SurveyLocationDB).count() == 0
+
+def test_report_species_location_database_locked(test_db: Session, monkeypatch):
+    species, *_ = create_species(test_db)
+
+    def locked(*args, **kwargs):
+        raise exc.OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+    monkeypatch.setattr("src.app.api.find_or_create_survey_location", locked)
+    response = client.post(f"/species/{species.id}/locations", json=dict(latitude=1.0, longitude=2.0))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
 #
 # get_species_at_location tests
 #
@@ -16,7 +42,10 @@ def test_get_species_at_location_invalid_param(test_db):
         "/location/species?latitude=-16.556",
         "/location/species?longitude=10.77",
         "/location/species?latitude=a&longitude=b",
-
+        "/location/species?latitude=nan&longitude=10.77",
+        "/location/species?latitude=1e9&longitude=10.77",
+        "/location/species?latitude=-16.556&longitude=181",
+        "/location/species?latitude=-16.556&longitude=10.77&radius=nan",
     ):
         response = client.get(invalid_param_url)
         assert response.status_code == 422
@@ -99,6 +128,53 @@ def test_get_species_at_location_with_radius_ok(test_db: Session):
     change_survey_location(sl1, radius/2, radius/3, test_db)
     run_test(lat, lon, radius, [s1])
 
+#
+# get_species_in_area tests
+#
+
+def test_get_species_in_area_invalid_body(test_db):
+    bounding_box = dict(min_latitude=0, max_latitude=1, min_longitude=0, max_longitude=1)
+    for invalid_body in (
+        dict(),
+        dict(bounding_box=bounding_box, wkt="POLYGON ((0 0, 1 0, 1 1, 0 0))"),
+        dict(wkt="POINT (0 0)"),
+        dict(bounding_box=dict(min_latitude=0, max_latitude=1)),
+        dict(bounding_box=dict(bounding_box, max_latitude=1e9)),
+        dict(wkt="POLYGON ((0 0, 1 0, 1 nan, 0 0))"),
+        dict(wkt="POLYGON ((0 0, 1000 0, 1 1, 0 0))"),
+        dict(wkt="POLYGON ((0 0, 1 0, 1 1, 0 0)), (x"),
+        dict(bounding_box=dict(bounding_box, min_latitude=1, max_latitude=-90)),
+        dict(bounding_box=dict(bounding_box, min_longitude=1, max_longitude=0)),
+    ):
+        response = client.post("/location/species/area", json=invalid_body)
+        assert response.status_code == 422
+
+
+def test_get_species_in_area_ok(test_db: Session):
+    def run_test(area: dict, matching_species: list[SpeciesDB]):
+        response = client.post("/location/species/area", json=area)
+        assert response.status_code == 200
+        assert response.json() == [species_response(s) for s in matching_species]
+
+    s1, s2, s3 = create_species(test_db)
+    sl = add_species_location_at_location(s2, 0.5, 0.5, test_db)
+    add_species_location_at_location(s1, -1.0, 1.0, test_db)
+    add_species_location_at_location(s3, 2.0, 0.0, test_db)
+    sl.coordinate_uncertainty_in_meters = 20_000
+    sl = add_species_location_at_location(s3, 1.1, 0.5, test_db)
+    sl.coordinate_uncertainty_in_meters = 20_000
+    test_db.commit()
+
+    bounding_box = dict(min_latitude=-1, max_latitude=1, min_longitude=0, max_longitude=1)
+    run_test(dict(bounding_box=bounding_box), [s2, s1])
+    run_test(dict(bounding_box=bounding_box, include_uncertainty=True), [s2, s1, s3])
+
+    # Triangle containing the location at (0.5, 0.5), with (1.1, 0.5) just outside its top corner
+    triangle = "POLYGON ((0 0, 1 0, 0.5 1, 0 0))"
+    run_test(dict(wkt=triangle), [s2])
+    run_test(dict(wkt=triangle, include_uncertainty=True), [s2, s3])
+    run_test(dict(wkt="POLYGON ((10 10, 11 10, 11 11, 10 10))", include_uncertainty=True), [])
+
 #
 # get_all_species_tests
 #
@@ -134,6 +210,26 @@ def test_get_all_location_ok(test_db: Session):
         check_response(response, [species[page]], page=page, page_size=page_size)
 
 
+#
+# get_species_count_total tests
+#
+
+def test_get_species_count_total_ok(test_db: Session):
+    def check_count(count: int):
+        for url in ("/species/count", "/species/count?exact=true"):
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.json() == dict(count=count)
+
+    check_count(0)
+
+    species, *_ = create_species(test_db)
+    check_count(3)
+
+    client.delete(f"/species/{species.id}")
+    check_count(2)
+
+
 #
 # get_species_locations tests
 #
@@ -165,6 +261,98 @@ def test_get_species_locations_ok(test_db: Session):
         ) for sl in survey_locations
     ]
 
+#
+# get_batch_species_locations tests
+#
+
+def test_get_batch_species_locations_invalid_body(test_db):
+    for invalid_body in (
+        dict(),
+        dict(scientific_name_ids=[]),
+        dict(scientific_name_ids=["a"]),
+    ):
+        response = client.post("/species/locations/batch", json=invalid_body)
+        assert response.status_code == 422
+
+
+def test_get_batch_species_locations_ok(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    sl1 = add_species_location_at_location(s1, 0.0, 0.0, test_db)
+    sl2 = add_species_location_at_location(s1, -16.999, 17.22, test_db)
+    sl3 = add_species_location_at_location(s2, 52.77, -66.66, test_db)
+
+    def location_response(sl: SurveyLocationDB) -> dict:
+        return dict(id=sl.id, latitude=sl.latitude, longitude=sl.longitude)
+
+    response = client.post(
+        "/species/locations/batch",
+        json=dict(scientific_name_ids=[s1.id, 123, s3.id, s2.id, s1.id])
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        dict(
+            scientific_name_id=s1.id,
+            found=True,
+            locations=[location_response(sl1), location_response(sl2)],
+            locations_count=2
+        ),
+        dict(scientific_name_id=123, found=False),
+        dict(scientific_name_id=s3.id, found=True, locations=[], locations_count=0),
+        dict(
+            scientific_name_id=s2.id,
+            found=True,
+            locations=[location_response(sl3)],
+            locations_count=1
+        ),
+    ]
+
+    response = client.post(
+        "/species/locations/batch",
+        json=dict(scientific_name_ids=[s1.id, 123, s3.id, s2.id], counts_only=True)
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        dict(scientific_name_id=s1.id, found=True, locations_count=2),
+        dict(scientific_name_id=123, found=False),
+        dict(scientific_name_id=s3.id, found=True, locations_count=0),
+        dict(scientific_name_id=s2.id, found=True, locations_count=1),
+    ]
+
+#
+# get_species_cooccurrence tests
+#
+
+def test_get_species_cooccurrence_id_not_found(test_db):
+    response = client.get("/species/123/cooccurrence")
+    assert response.status_code == 404
+
+
+def test_get_species_cooccurrence_ok(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    survey_location = add_species_location_at_location(s1, 0.0, 0.0, test_db)
+    test_db.add(SpeciesLocationDB(species_id=s2.id, survey_location_id=survey_location.id))
+    add_species_location_at_location(s2, 1.0, 1.0, test_db)
+    add_species_location_at_location(s3, 0.0, 0.0, test_db)
+
+    response = client.get(f"/species/{s1.id}/cooccurrence")
+    assert response.status_code == 200
+    assert response.json() == [
+        dict(species=species_response(s2), shared_locations=1, jaccard=0.5)
+    ]
+
+    response = client.get(f"/species/{s3.id}/cooccurrence")
+    assert response.status_code == 200
+    assert response.json() == []
+
+    response = client.get("/cooccurrence")
+    assert response.status_code == 200
+    assert response.json() == [
+        dict(species=[species_response(s1), species_response(s2)], shared_locations=1, jaccard=0.5)
+    ]
+
+    response = client.get("/cooccurrence?metric=spam")
+    assert response.status_code == 422
+
 #
 # delete_species tests
 #
@@ -187,6 +375,42 @@ def test_get_delete_species_id_ok(test_db: Session):
     assert not test_db.query(SpeciesLocationDB).count()
 
 
+def test_delete_many_species_no_filters(test_db):
+    create_species(test_db)
+    response = client.delete("/species")
+    assert response.status_code == 422
+    assert test_db.query(SpeciesDB).count() == 3
+
+
+def test_delete_many_species_ok(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    for species in (s1, s2, s3):
+        add_species_location_at_location(species, 0.0, 0.0, test_db)
+
+    response = client.delete(f"/species?scientific_name_id={s1.id}&scientific_name_id=123")
+    assert response.status_code == 200
+    assert response.json() == dict(deleted_count=1)
+
+    response = client.delete("/species?kingdom=Plantae")
+    assert response.status_code == 200
+    assert response.json() == dict(deleted_count=1)
+
+    test_db.expire_all()
+    assert [s.id for s in test_db.query(SpeciesDB)] == [s3.id]
+    assert [sl.species_id for sl in test_db.query(SpeciesLocationDB)] == [s3.id]
+
+def test_delete_many_species_batched(test_db: Session):
+    s1, s2, s3 = create_species(test_db)
+    # More species ids than fit in a single IN clause
+    ids = [s1.id, *range(1, 1001), s3.id]
+    remaining = sorted([s1.id, s2.id])
+    response = client.delete("/species", params=dict(scientific_name_id=ids, kingdom="Animalia"))
+    assert response.status_code == 200
+    assert response.json() == dict(deleted_count=1)
+
+    test_db.expire_all()
+    assert sorted(s.id for s in test_db.query(SpeciesDB)) == remaining
+
 # TODO: add tests for patch_species
 
 # TODO: add tests for report_species_location
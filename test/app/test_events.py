@@ -0,0 +1,93 @@
+import asyncio
+from sqlalchemy.orm import Session
+from src.app.events import EventBus, RegionFilter, event_bus
+from src.app.schemas import SpeciesLocationEvent, Species, SurveyLocation
+
+from ..conftest import client
+from .helpers import create_species, SPECIES1, SPECIES3
+
+
+def species_location_event(id: int, species: dict, latitude: float, longitude: float) -> SpeciesLocationEvent:
+    return SpeciesLocationEvent(
+        id=id,
+        species=Species(**species),
+        survey_location=SurveyLocation(id=id, latitude=latitude, longitude=longitude, locality=None)
+    )
+
+
+def test_region_filter_matches():
+    bounding_box = RegionFilter(min_latitude=-10, max_latitude=10, min_longitude=170, max_longitude=180)
+    assert bounding_box.matches(-10.0, 180.0)
+    assert not bounding_box.matches(0.0, 169.999999)
+
+    radius = RegionFilter(latitude=0.0, longitude=0.0, radius=5)
+    assert radius.matches(3.0, -4.0)
+    assert not radius.matches(3.0, 4.000001)
+
+    point = RegionFilter(latitude=-17.12, longitude=20.55)
+    assert point.matches(-17.12, 20.55)
+    assert not point.matches(-17.12, 20.56)
+
+
+def test_event_bus_publish():
+    bus = EventBus(max_queued_events=1)
+
+    async def run():
+        fiji = bus.subscribe(RegionFilter(latitude=-17.0, longitude=179.0, radius=2))
+        sponges = bus.subscribe(
+            RegionFilter(min_latitude=-90, max_latitude=90, min_longitude=-180, max_longitude=180),
+            dict(phylum="Porifera")
+        )
+        # Publish from another thread, as the API's write path does
+        await asyncio.to_thread(bus.publish, species_location_event(1, SPECIES1, -16.5, 179.5))
+        await asyncio.to_thread(bus.publish, species_location_event(2, SPECIES3, -16.5, 179.5))
+        await asyncio.to_thread(bus.publish, species_location_event(3, SPECIES3, 50.0, 0.0))
+        await asyncio.sleep(0)
+        received = (
+            [(await fiji.get()).id for _ in range(fiji.queue.qsize())],
+            [(await sponges.get()).id for _ in range(sponges.queue.qsize())]
+        )
+        bus.unsubscribe(fiji)
+        bus.publish(species_location_event(4, SPECIES1, -17.0, 179.0))
+        await asyncio.sleep(0)
+        return received, fiji.queue.qsize(), fiji.dropped, sponges.dropped
+
+    # Queues hold a single event, so further events for a slow subscriber are dropped
+    assert asyncio.run(run()) == (([1], [2]), 0, 1, 1)
+
+
+def test_report_species_location_publishes_event(test_db: Session):
+    s1, *_ = create_species(test_db)
+
+    async def run():
+        subscription = event_bus.subscribe(RegionFilter(latitude=-16.0, longitude=179.0, radius=1))
+        try:
+            for latitude in (-16.5, 0.0):
+                response = await asyncio.to_thread(
+                    client.post,
+                    f"/species/{s1.id}/locations",
+                    json=dict(latitude=latitude, longitude=179.0)
+                )
+                assert response.status_code == 200
+            return await asyncio.wait_for(subscription.get(), 1), subscription.queue.qsize()
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    event, queued = asyncio.run(run())
+    assert queued == 0
+    assert event.species.id == s1.id
+    assert (event.survey_location.latitude, event.survey_location.longitude) == (-16.5, 179.0)
+
+
+def test_get_species_location_events_invalid_region(test_db):
+    for invalid_param_url in (
+        "/location/species/events",
+        "/location/species/events?latitude=1.0",
+        "/location/species/events?min_latitude=1.0&max_latitude=2.0&min_longitude=3.0",
+        "/location/species/events?latitude=1.0&longitude=2.0&min_latitude=1.0&max_latitude=2.0"
+        "&min_longitude=3.0&max_longitude=4.0",
+        "/location/species/events?latitude=nan&longitude=2.0",
+        "/location/species/events?min_latitude=1.0&max_latitude=1e9&min_longitude=3.0&max_longitude=4.0",
+    ):
+        response = client.get(invalid_param_url)
+        assert response.status_code == 422
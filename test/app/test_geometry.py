@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from src.app.geometry import (
+    parse_wkt_polygon,
+    bounding_box_edges,
+    edges_bounds,
+    points_in_polygon,
+    distances_to_edges,
+    meters_to_degrees
+)
+
+SQUARE_WITH_HOLE = "POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0), (4 4, 6 4, 6 6, 4 6, 4 4))"
+
+
+def test_parse_wkt_polygon_ok():
+    edges = parse_wkt_polygon(SQUARE_WITH_HOLE)
+    assert edges.shape == (8, 4)
+    assert edges[0].tolist() == [0, 0, 10, 0]
+    assert edges_bounds(edges) == (0, 10, 0, 10)
+
+    edges = parse_wkt_polygon("MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), ((179 -17, 180 -17, 180 -16, 179 -17)))")
+    assert edges.shape == (6, 4)
+    assert edges_bounds(edges) == (-17, 1, 0, 180)
+
+
+def test_parse_wkt_polygon_invalid():
+    for invalid_wkt in (
+        "POINT (179.73695 -16.185317)",
+        "POLYGON EMPTY",
+        "POLYGON ((0 0, 1 0, 0 0))",
+        "POLYGON ((0 0, 1 0, 1 1, 0 1))",
+        "POLYGON ((0 0, 1 a, 1 1, 0 0))",
+        "POLYGON ((0 0 0, 1 0 0, 1 1 0, 0 0 0))",
+        "POLYGON ((0 0, 1 0, 1 1, 0 0)), (x",
+        "POLYGON ((0 0, 1 0, 1 1, 0 0)) junk",
+        "POLYGON (0 0, 1 0, 1 1, 0 0)",
+        "POLYGON (((0 0, 1 0, 1 1, 0 0)))",
+        "MULTIPOLYGON ((0 0, 1 0, 1 1, 0 0))",
+    ):
+        with pytest.raises(ValueError):
+            parse_wkt_polygon(invalid_wkt)
+
+
+def test_points_in_polygon():
+    edges = parse_wkt_polygon(SQUARE_WITH_HOLE)
+    longitudes = np.array([1.0, 5.0, 9.9, 11.0, 3.0, -1.0])
+    latitudes = np.array([1.0, 5.0, 9.9, 5.0, 5.0, 5.0])
+    assert points_in_polygon(longitudes, latitudes, edges).tolist() == [True, False, True, False, True, False]
+
+    edges = bounding_box_edges(min_latitude=-17, max_latitude=-16, min_longitude=179, max_longitude=180)
+    assert points_in_polygon(np.array([179.5, 178.5]), np.array([-16.5, -16.5]), edges).tolist() == [True, False]
+
+
+def test_distances_to_edges():
+    edges = bounding_box_edges(min_latitude=0, max_latitude=1, min_longitude=0, max_longitude=1)
+    distances = distances_to_edges(np.array([0.5, 2.0, 0.5]), np.array([-1.0, 0.5, 0.5]), edges)
+    assert distances == pytest.approx([111_320, 111_320, 55_660], rel=1e-3)
+
+
+def test_meters_to_degrees():
+    assert meters_to_degrees(111_320, 0) == pytest.approx((1, 1))
+    assert meters_to_degrees(111_320, 60) == pytest.approx((1, 2))
@@ -0,0 +1,170 @@
+import asyncio
+import gzip
+import os
+import time
+import pytest
+from sqlalchemy.orm import Session
+
+from src.app.database import SpeciesDB, SurveyLocationDB, SpeciesLocationDB
+from src.app.events import RegionFilter, event_bus
+from src.app.imports import UploadSpool, UploadTooLargeError
+
+from ..conftest import client
+from ..scripts.test_import_data import CSV_HEADER, CSV_ROWS, invalid_row
+
+def wait_for_import(job_id: str, timeout: float = 10) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(f"/imports/{job_id}")
+        assert response.status_code == 200
+        job = response.json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_upload_spool(tmp_path, chunk_size):
+    data = (CSV_HEADER + CSV_ROWS + "\n" + invalid_row("-91", "179.7", "30", "145123") + CSV_ROWS).encode()
+    upload = UploadSpool(directory=tmp_path)
+    for start in range(0, len(data), chunk_size):
+        upload.write(data[start:start + chunk_size])
+    upload.close()
+    assert upload.errors == [(5, "decimalLatitude '-91' is not between -90 and 90")]
+    assert upload.row_count == 5
+    with open(upload.filepath, "rb") as f:
+        assert f.read() == data
+    upload.discard()
+    assert not os.path.exists(upload.filepath)
+
+def test_upload_spool_max_errors(tmp_path):
+    upload = UploadSpool(max_errors=2, directory=tmp_path)
+    upload.write((CSV_HEADER + invalid_row("-91", "spam", "30", "145123") * 3).encode())
+    assert upload.full
+    upload.close()
+    assert len(upload.errors) == 2
+    upload.discard()
+
+def test_upload_spool_gzip(tmp_path):
+    data = gzip.compress((CSV_HEADER + CSV_ROWS).encode())
+    upload = UploadSpool(gzip=True, directory=tmp_path)
+    upload.write(data[:10])
+    upload.write(data[10:])
+    upload.close()
+    assert upload.errors == []
+    assert upload.row_count == 2
+    upload.discard()
+
+    upload = UploadSpool(gzip=True, directory=tmp_path)
+    with pytest.raises(ValueError):
+        upload.write(b"not gzip data")
+    upload.discard()
+
+def test_upload_spool_max_size(tmp_path):
+    # Compressed data that expands far beyond the limit is rejected without decompressing all of it
+    data = gzip.compress(CSV_HEADER.encode() + b"\n" * 20_000_000)
+    upload = UploadSpool(gzip=True, max_size=1_000_000, directory=tmp_path)
+    with pytest.raises(UploadTooLargeError):
+        upload.write(data)
+    assert upload.size <= 2_100_000
+    upload.discard()
+
+
+def test_create_import_ok(test_db: Session):
+    def body():
+        # Body is streamed in chunks that split rows
+        data = (CSV_HEADER + CSV_ROWS).encode()
+        yield data[:100]
+        yield data[100:]
+
+    response = client.post("/imports", content=body(), headers={"Content-Type": "text/csv"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "running", "succeeded")
+    assert job["rows_total"] == 2
+
+    job = wait_for_import(job["id"])
+    assert job["status"] == "succeeded"
+    assert job["rows_processed"] == 2
+    assert job["error"] is None
+    assert job["finished_at"] is not None
+
+    assert sorted(s.id for s in test_db.query(SpeciesDB)) == [145123, 372311]
+    assert test_db.query(SurveyLocationDB).count() == 1
+    assert test_db.query(SpeciesLocationDB).count() == 2
+
+def test_create_import_gzip(test_db: Session):
+    response = client.post(
+        "/imports",
+        content=gzip.compress((CSV_HEADER + CSV_ROWS).encode()),
+        headers={"Content-Type": "text/csv", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 202
+    assert wait_for_import(response.json()["id"])["status"] == "succeeded"
+    assert test_db.query(SpeciesLocationDB).count() == 2
+
+    response = client.post("/imports", content=b"not gzip data", headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+def test_create_import_gzip_invalid(test_db: Session):
+    # The rest of the upload isn't read once the maximum number of errors is found
+    response = client.post(
+        "/imports",
+        content=gzip.compress((CSV_HEADER + invalid_row("-91", "179.7", "30", "145123") * 20_000).encode()),
+        headers={"Content-Type": "text/csv", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 422
+    assert len(response.json()["detail"]) == 100
+
+def test_create_import_too_large(test_db: Session, monkeypatch):
+    monkeypatch.setattr("src.app.api.MAX_IMPORT_SIZE", 100)
+    response = client.post("/imports", content=CSV_HEADER + CSV_ROWS)
+    assert response.status_code == 413
+    assert test_db.query(SpeciesDB).count() == 0
+
+def test_create_import_publishes_events(test_db: Session):
+    async def run():
+        subscription = event_bus.subscribe(RegionFilter(latitude=-16.0, longitude=179.0, radius=1))
+        try:
+            response = await asyncio.to_thread(client.post, "/imports", content=CSV_HEADER + CSV_ROWS)
+            assert response.status_code == 202
+            job = await asyncio.to_thread(wait_for_import, response.json()["id"])
+            assert job["status"] == "succeeded"
+            return [await asyncio.wait_for(subscription.get(), 1) for _ in range(2)]
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    events = asyncio.run(run())
+    assert [event.species.id for event in events] == [145123, 372311]
+    assert {(event.survey_location.latitude, event.survey_location.longitude) for event in events} == {
+        (-16.185317, 179.73695)
+    }
+
+def test_create_import_invalid(test_db: Session):
+    response = client.post(
+        "/imports",
+        content=CSV_HEADER + CSV_ROWS + invalid_row("-16.1", "spam", "30", "145123")
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == [dict(line=4, message="decimalLongitude 'spam' is not a number")]
+
+    response = client.post("/imports", content='"locality","decimalLatitude"\n')
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["message"].startswith("missing columns decimalLongitude")
+
+    # Rows after an invalid header aren't validated
+    response = client.post("/imports", content='"locality","decimalLatitude"\n"Vanua Levu",-16.1\n')
+    assert response.status_code == 422
+    assert len(response.json()["detail"]) == 1
+    assert response.json()["detail"][0]["line"] == 1
+
+    response = client.post("/imports", content=b"")
+    assert response.status_code == 422
+    assert response.json()["detail"] == [dict(line=1, message="file is empty")]
+
+    # Nothing is imported from an invalid file
+    assert test_db.query(SpeciesDB).count() == 0
+
+def test_get_import_not_found():
+    response = client.get("/imports/123")
+    assert response.status_code == 404
@@ -0,0 +1,170 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from src.app.database import (
+    ShardRouter,
+    ShardSessions,
+    SpeciesDB,
+    SurveyLocationDB,
+    SpeciesLocationDB,
+    SHARD_ID_BITS
+)
+from src.app.api import api, get_db, get_shard_router
+
+from ..conftest import client, TestingSessionLocal
+from .helpers import create_species, species_response
+
+@pytest.fixture()
+def router(test_db: Session, tmp_path):
+    router = ShardRouter(
+        grid_degrees=1,
+        database_url=f"sqlite:///{tmp_path}/shard_{{latitude_cell}}_{{longitude_cell}}.sqlite"
+    )
+    api.dependency_overrides[get_shard_router] = lambda: router
+    try:
+        yield router
+    finally:
+        del api.dependency_overrides[get_shard_router]
+
+
+def report_location(species: SpeciesDB, latitude: float, longitude: float):
+    response = client.post(
+        f"/species/{species.id}/locations",
+        json=dict(latitude=latitude, longitude=longitude)
+    )
+    assert response.status_code == 200
+
+
+def test_router_disabled(test_db: Session):
+    shards = ShardSessions(test_db, ShardRouter())
+    assert not shards.enabled
+    assert shards.for_point(1.5, 2.5) is test_db
+    assert shards.for_bounds(0, 1, 0, 1) == [test_db]
+    assert shards.all() == [test_db]
+
+def test_router_cell():
+    router = ShardRouter(grid_degrees=0.5)
+    assert router.cell(0.2, 0.7) == (0, 1)
+    assert router.cell(-0.2, -0.7) == (-1, -2)
+    assert router.cell("1.0", "-179.9") == (2, -360)
+    # Cells are found from the quantized coordinates points are stored at
+    assert router.cell(0.9999996, 1.9999996) == (2, 4)
+    with pytest.raises(ValueError):
+        router.cell(float("nan"), 0)
+
+def test_shard_routed_by_quantized_coordinates(test_db: Session, router: ShardRouter):
+    s1, _, _ = create_species(test_db)
+    report_location(s1, 0.9999996, 5.5)
+
+    response = client.get("/location/species?latitude=1.0&longitude=5.5")
+    assert response.status_code == 200
+    assert response.json() == [species_response(s1)]
+    response = client.post(
+        "/location/species/area",
+        json=dict(bounding_box=dict(min_latitude=1, max_latitude=2, min_longitude=5, max_longitude=6))
+    )
+    assert response.status_code == 200
+    assert response.json() == [species_response(s1)]
+
+def test_shard_writes_routed_by_location(test_db: Session, router: ShardRouter):
+    s1, s2, _ = create_species(test_db)
+    report_location(s1, 10.5, 20.5)
+    report_location(s2, 10.7, 20.1)
+    report_location(s2, -10.5, 20.5)
+
+    shards = router.find_shards(test_db)
+    assert [(shard.latitude_cell, shard.longitude_cell) for shard in shards] == [(10, 20), (-11, 20)]
+    # Nothing is written to the main database except the shard registry and species
+    assert test_db.query(SurveyLocationDB).count() == 0
+    assert test_db.query(SpeciesLocationDB).count() == 0
+
+    with ShardSessions(test_db, router) as sessions:
+        first, second = sessions.all()
+        assert first.query(SurveyLocationDB).count() == 2
+        assert {s.id for s in first.query(SpeciesDB)} == {s1.id, s2.id}
+        assert second.query(SurveyLocationDB).count() == 1
+        assert {s.id for s in second.query(SpeciesDB)} == {s2.id}
+        # Ids are allocated from each shard's own range, so are unique across shards
+        first_ids = {location.id for location in first.query(SurveyLocationDB)}
+        second_ids = {location.id for location in second.query(SurveyLocationDB)}
+        assert {id >> SHARD_ID_BITS for id in first_ids} == {shards[0].id}
+        assert {id >> SHARD_ID_BITS for id in second_ids} == {shards[1].id}
+
+def test_shard_reads_fan_out(test_db: Session, router: ShardRouter):
+    s1, s2, s3 = create_species(test_db)
+    report_location(s1, 10.9, 20.5)
+    report_location(s2, 11.1, 20.5)
+    report_location(s3, 30.0, 30.0)
+
+    # Radius crossing the boundary between two shards
+    response = client.get("/location/species?latitude=11.0&longitude=20.5&radius=0.2")
+    assert response.status_code == 200
+    assert response.json() == [species_response(s1), species_response(s2)]
+
+    response = client.post(
+        "/location/species/area",
+        json=dict(bounding_box=dict(
+            min_latitude=10, max_latitude=12, min_longitude=20, max_longitude=21
+        ))
+    )
+    assert response.status_code == 200
+    assert response.json() == [species_response(s1), species_response(s2)]
+
+    response = client.get(f"/species/{s3.id}/locations")
+    assert response.status_code == 200
+    assert [(l["latitude"], l["longitude"]) for l in response.json()] == [(30.0, 30.0)]
+
+    response = client.post(
+        "/species/locations/batch",
+        json=dict(scientific_name_ids=[s1.id, s2.id, 1], counts_only=True)
+    )
+    assert response.status_code == 200
+    assert [(s["found"], s.get("locations_count")) for s in response.json()] == [
+        (True, 1), (True, 1), (False, None)
+    ]
+
+def test_shard_species_changes_propagated(test_db: Session, router: ShardRouter):
+    s1, s2, _ = create_species(test_db)
+    report_location(s1, 10.5, 20.5)
+    report_location(s2, 10.5, 20.5)
+
+    response = client.patch(f"/species/{s1.id}", json=dict(name="New name"))
+    assert response.status_code == 200
+    response = client.delete(f"/species/{s2.id}")
+    assert response.status_code == 200
+
+    with ShardSessions(test_db, router) as sessions:
+        shard, = sessions.all()
+        assert shard.get(SpeciesDB, s1.id).name == "New name"
+        assert shard.get(SpeciesDB, s2.id) is None
+        assert [l.species_id for l in shard.query(SpeciesLocationDB)] == [s1.id]
+
+    response = client.get("/location/species?latitude=10.5&longitude=20.5")
+    assert response.status_code == 200
+    assert [s["name"] for s in response.json()] == ["New name"]
+
+def test_shard_species_changes_undone(test_db: Session, router: ShardRouter, monkeypatch):
+    s1, s2, _ = create_species(test_db)
+    report_location(s1, 10.5, 20.5)
+    report_location(s2, 10.5, 20.5)
+
+    # Fail the commit of the main database, which happens after the shards are committed
+    def fail_commit():
+        raise OSError("disk full")
+    def get_failing_db():
+        with TestingSessionLocal() as db:
+            db.commit = fail_commit
+            yield db
+    monkeypatch.setitem(api.dependency_overrides, get_db, get_failing_db)
+    with pytest.raises(OSError):
+        client.patch(f"/species/{s1.id}", json=dict(name="New name"))
+    with pytest.raises(OSError):
+        client.delete(f"/species/{s2.id}")
+    monkeypatch.undo()
+
+    # The changes committed to the shard are undone
+    with ShardSessions(test_db, router) as sessions:
+        shard, = sessions.all()
+        assert shard.get(SpeciesDB, s1.id).name == s1.name
+        assert shard.get(SpeciesDB, s2.id) is not None
+        assert sorted(l.species_id for l in shard.query(SpeciesLocationDB)) == sorted([s1.id, s2.id])
@@ -1,6 +1,14 @@
+import pytest
 from sqlalchemy.orm import Session
-from src.app.utils import find_or_create_survey_location
-from src.app.database import SurveyLocationDB
+from .helpers import create_species
+from src.app.utils import find_or_create_survey_location, get_species_count
+from src.app.database import (
+    SpeciesDB,
+    SurveyLocationDB,
+    quantize_coordinate,
+    pack_coordinates,
+    coordinates_key_range
+)
 
 def test_find_or_create_survey_location_created_ok(test_db: Session):
     lat, lon = (22.2, 33.3)
@@ -22,5 +30,40 @@ def test_find_or_create_survey_location_found_ok(test_db: Session):
     assert sl == result
 
 
+def test_find_or_create_survey_location_quantized_ok(test_db: Session):
+    sl = find_or_create_survey_location(test_db, "-16.185317", "179.73695")
+    test_db.commit()
+    assert sl.latitude_e6 == -16185317
+    assert sl.longitude_e6 == 179736950
+    # Coordinates that only differ by float rounding find the same location
+    result = find_or_create_survey_location(test_db, -16.1853170000001, 179.73695 + 1e-12)
+    assert sl == result
+    assert test_db.query(SurveyLocationDB).count() == 1
+
+
+def test_pack_coordinates_ordered_by_latitude():
+    keys = [
+        pack_coordinates(quantize_coordinate(lat), quantize_coordinate(lon))
+        for lat, lon in [(-90.0, 180.0), (-1.0, -180.0), (-1.0, 0.0), (0.0, -180.0), (90.0, 180.0)]
+    ]
+    assert keys == sorted(keys)
+    min_key, max_key = coordinates_key_range(quantize_coordinate(-1.0), quantize_coordinate(-1.0))
+    assert [min_key <= key <= max_key for key in keys] == [False, True, True, False, False]
+
+def test_quantize_coordinate_not_finite():
+    for value in (float("nan"), float("inf"), "-inf"):
+        with pytest.raises(ValueError):
+            quantize_coordinate(value)
+
+
+def test_get_species_count_maintained_ok(test_db: Session):
+    assert get_species_count(test_db) == 0
+    create_species(test_db)
+    assert get_species_count(test_db) == get_species_count(test_db, exact=True) == 3
+    # Counter is kept up to date by bulk deletes as well as ORM writes
+    test_db.query(SpeciesDB).filter(SpeciesDB.kingdom == "Plantae").delete()
+    test_db.commit()
+    assert get_species_count(test_db) == get_species_count(test_db, exact=True) == 1
+
 # TODO add tests for find_or_create_species
 
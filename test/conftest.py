@@ -4,7 +4,7 @@ from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
 from src.app.database import Base
-from src.app.api import api, get_db
+from src.app.api import api, get_db, get_session_factory
 
 TEST_DATABASE_URL = "sqlite:///db.test"
 
@@ -30,5 +30,6 @@ def override_get_db():
         db.close()
 
 api.dependency_overrides[get_db] = override_get_db
+api.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
 
 client = TestClient(api)
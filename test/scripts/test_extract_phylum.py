@@ -29,20 +29,18 @@ def test_get_all_species():
 
 def test_get_locations_count():
     species = copy.deepcopy(SPECIES)
-    responses = [
-        [],
-        [{"latitude": 55.5, "longitude" : 22.5}],
-        [{"latitude": -55.1, "longitude" : -11.111}, {"latitude": -99.9, "longitude" : 7.2}]
-    ]
+    counts = [0, 1, 2]
     with aioresponses() as mock_session:
-        for i, s in enumerate(species):
-            mock_session.get(
-                f"{API_BASE_URL}/species/{s['id']}/locations",
-                payload=responses[i]
-            )
+        mock_session.post(
+            f"{API_BASE_URL}/species/locations/batch",
+            payload=[
+                dict(scientific_name_id=s["id"], found=True, locations_count=counts[i])
+                for i, s in enumerate(species)
+            ]
+        )
         expected_species = copy.deepcopy(SPECIES)
         for i, s in enumerate(expected_species):
-            s["locations_count"] = len(responses[i])
+            s["locations_count"] = counts[i]
         asyncio.run((get_locations_count(species)))
         assert species == expected_species
 
@@ -1,3 +1,162 @@
-from src.scripts.import_data import main
+from sqlalchemy.orm import Session
+from src.app.database import SpeciesDB, SurveyLocationDB, SpeciesLocationDB, ShardRouter, ShardSessions
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+from src.scripts.import_data import main, import_data, validate_data
+
+CSV_HEADER = (
+    '"locality","decimalLatitude","decimalLongitude","geodeticDatum","coordinateUncertaintyInMeters",'
+    '"footprintWKT","scientificNameID","scientificName","kingdom","phylum","class","order_","family",'
+    '"genus","scientificNameAuthorship","FID"\n'
+)
+CSV_ROWS = (
+    '"Vanua Levu",-16.185317,179.73695,"WGS84",30,"POINT (179.73695 -16.185317)",145123,'
+    '"Jania adhaerens","Plantae","Rhodophyta","Florideophyceae","Corallinales","Corallinaceae","Jania",'
+    '"J.V.Lamouroux, 1816",1\n'
+    '"Vanua Levu",-16.185317,179.73695,"WGS84",,,"urn:lsid:marinespecies.org:taxname:372311",'
+    '"Rhipiliella verticillata","Plantae","Chlorophyta","Ulvophyceae","Bryopsidales","Udoteaceae",'
+    '"Rhipiliella","Kraft, 1986",2\n'
+)
+
+
+def test_import_data_ok(test_db: Session, tmp_path):
+    filepath = tmp_path / "survey.csv"
+    filepath.write_text(CSV_HEADER + CSV_ROWS)
+    import_data(filepath, test_db)
+    test_db.commit()
+
+    assert sorted(s.id for s in test_db.query(SpeciesDB)) == [145123, 372311]
+    assert test_db.query(SpeciesLocationDB).count() == 2
+    survey_location = test_db.query(SurveyLocationDB).one()
+    assert (survey_location.latitude, survey_location.longitude) == (-16.185317, 179.73695)
+    assert survey_location.coordinate_uncertainty_in_meters == 30
+    assert survey_location.footprint_wkt == "POINT (179.73695 -16.185317)"
+
+
+def test_import_data_sharded(test_db: Session, tmp_path):
+    filepath = tmp_path / "survey.csv"
+    filepath.write_text(CSV_HEADER + CSV_ROWS)
+    router = ShardRouter(
+        grid_degrees=1,
+        database_url=f"sqlite:///{tmp_path}/shard_{{latitude_cell}}_{{longitude_cell}}.sqlite"
+    )
+    with ShardSessions(test_db, router) as shards:
+        import_data(filepath, test_db, shards)
+        shards.commit()
+
+        assert sorted(s.id for s in test_db.query(SpeciesDB)) == [145123, 372311]
+        assert test_db.query(SpeciesLocationDB).count() == 0
+        shard, = shards.all()
+        assert sorted(s.id for s in shard.query(SpeciesDB)) == [145123, 372311]
+        assert shard.query(SpeciesLocationDB).count() == 2
+        survey_location = shard.query(SurveyLocationDB).one()
+        assert (survey_location.latitude, survey_location.longitude) == (-16.185317, 179.73695)
+
+
+def test_import_data_sharded_shared_species(test_db: Session, tmp_path):
+    filepath = tmp_path / "survey.csv"
+    # Species 145123 is observed in two shards
+    filepath.write_text(CSV_HEADER + CSV_ROWS + invalid_row("-17.5", "178.5", "30", "145123"))
+    router = ShardRouter(
+        grid_degrees=1,
+        database_url=f"sqlite:///{tmp_path}/shard_{{latitude_cell}}_{{longitude_cell}}.sqlite"
+    )
+    with ShardSessions(test_db, router) as shards:
+        import_data(filepath, test_db, shards)
+        shards.commit()
+
+        assert sorted(s.id for s in test_db.query(SpeciesDB)) == [145123, 372311]
+        first, second = shards.all()
+        assert sorted(s.id for s in first.query(SpeciesDB)) == [145123, 372311]
+        assert [s.id for s in second.query(SpeciesDB)] == [145123]
+        assert second.query(SpeciesLocationDB).count() == 1
+
+
+def test_import_data_sharded_undone(test_db: Session, tmp_path, monkeypatch):
+    filepath = tmp_path / "survey.csv"
+    filepath.write_text(CSV_HEADER + CSV_ROWS)
+    router = ShardRouter(
+        grid_degrees=1,
+        database_url=f"sqlite:///{tmp_path}/shard_{{latitude_cell}}_{{longitude_cell}}.sqlite"
+    )
+    with ShardSessions(test_db, router) as shards:
+        import_data(filepath, test_db, shards)
+
+        def fail_commit():
+            raise OSError("disk full")
+        # The main database is committed after the shards
+        monkeypatch.setattr(test_db, "commit", fail_commit)
+        with pytest.raises(OSError):
+            shards.commit()
+        monkeypatch.undo()
+
+        # Nothing is left imported in either the shard or the main database
+        assert test_db.query(SpeciesDB).count() == 0
+        shard, = shards.all()
+        assert shard.query(SpeciesDB).count() == 0
+        assert shard.query(SurveyLocationDB).count() == 0
+        assert shard.query(SpeciesLocationDB).count() == 0
+
+
+def invalid_row(latitude: str, longitude: str, uncertainty: str, id: str) -> str:
+    return (
+        f'"Vanua Levu",{latitude},{longitude},"WGS84",{uncertainty},,"{id}","Jania adhaerens",'
+        '"Plantae","Rhodophyta","Florideophyceae","Corallinales","Corallinaceae","Jania","J.V.Lamouroux, 1816",1\n'
+    )
+
+
+@pytest.mark.parametrize("chunk_size, processes", [(1024 * 1024, None), (50, 1), (50, 2), (1, 4)])
+def test_validate_data(tmp_path, chunk_size, processes):
+    filepath = tmp_path / "survey.csv"
+    filepath.write_text(
+        CSV_HEADER
+        + CSV_ROWS
+        + invalid_row("-91", "179.7", "30", "145123")
+        + "\n"
+        + invalid_row("-16.1", "spam", "-1", "urn:lsid:marinespecies.org:taxname:")
+        + CSV_ROWS
+        + '"Vanua Levu",-16.1\n'
+        + invalid_row("1", "2", "3", "4")
+    )
+    assert validate_data(filepath, processes, chunk_size) == [
+        (4, "decimalLatitude '-91' is not between -90 and 90"),
+        (6, "decimalLongitude 'spam' is not a number"),
+        (6, "scientificNameID 'urn:lsid:marinespecies.org:taxname:' does not contain an integer id"),
+        (6, "coordinateUncertaintyInMeters '-1' is not a non-negative number"),
+        (9, "expected 16 fields but found 2"),
+    ]
+
+
+def test_validate_data_missing_columns(tmp_path):
+    filepath = tmp_path / "survey.csv"
+    filepath.write_text('"locality","decimalLatitude"\n"Vanua Levu",-16.1\n')
+    errors = validate_data(filepath)
+    assert len(errors) == 1
+    assert errors[0][0] == 1
+    assert errors[0][1].startswith("missing columns decimalLongitude, coordinateUncertaintyInMeters")
+
+
+def test_validate_data_real_file():
+    filepath = Path(__file__).parents[2] / "Survey_of_algae,_sponges,_and_ascidians,_Fiji,_2007.csv"
+    assert validate_data(filepath, chunk_size=16 * 1024) == []
+
+
+def test_validate_does_not_touch_database(tmp_path):
+    filepath = tmp_path / "survey.csv"
+    filepath.write_text(CSV_HEADER + CSV_ROWS)
+    result = subprocess.run(
+        [sys.executable, "-m", "src.scripts.import_data", "--validate", str(filepath)],
+        cwd=tmp_path,
+        env=dict(os.environ, PYTHONPATH=str(Path(__file__).parents[2])),
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert "No errors found" in result.stdout
+    # No database files are created in the working directory
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["survey.csv"]
 
 # TODO: write tests for main
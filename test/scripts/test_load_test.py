@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from src.app.database import SpeciesDB, SurveyLocationDB, SpeciesLocationDB
+from src.scripts.load_test import Sample, generate_database, summarise
+
+
+def test_generate_database(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'loadtest.sqlite'}"
+    generate_database(database_url, species=10, locations=20, observations=30, seed=0)
+    with Session(create_engine(database_url)) as db:
+        assert db.query(SpeciesDB).count() == 10
+        assert db.query(SurveyLocationDB).count() == 20
+        assert db.query(SpeciesLocationDB).count() == 30
+        survey_location = db.query(SurveyLocationDB).first()
+        assert -19 <= survey_location.latitude <= -15
+
+
+def test_summarise():
+    samples = [Sample("GET /species", 200, latency / 1000) for latency in range(1, 101)]
+    samples += [Sample("GET /location/species", 429, 0.001), Sample("GET /location/species", None, 0.003)]
+    summary = summarise(samples, duration=2)
+
+    assert list(summary) == ["GET /location/species", "GET /species", "all"]
+    species = summary["GET /species"]
+    assert species["requests"] == 100
+    assert species["throughput_rps"] == 50
+    assert species["error_rate"] == 0
+    assert species["status_counts"] == {"200": 100}
+    assert species["latency_ms"]["p50"] == pytest.approx(50.5)
+    assert species["latency_ms"]["p99"] == pytest.approx(99.01)
+    assert species["latency_ms"]["max"] == pytest.approx(100)
+    location = summary["GET /location/species"]
+    assert location["error_rate"] == 1
+    assert location["status_counts"] == {"429": 1, "connection_error": 1}
+    assert summary["all"]["requests"] == 102